@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""Benchmark suite for :mod:`data`.
+
+Runs every operation against every kind of backing (bytes, text, file-like
+and filename) for a range of payload sizes, plus the call overhead of the
+decorators and the memory used per instance. Copying files with
+:func:`shutil.copyfileobj` is measured as a reference for ``save_to``.
+Results are written as JSON, so runs of different versions can be compared:
+
+.. code-block:: sh
+
+    $ python benchmarks/suite.py -o before.json
+    $ git checkout my-branch
+    $ python benchmarks/suite.py -o after.json --compare before.json
+
+The suite benchmarks the checkout it is part of, not an installed version of
+:mod:`data`. ``--compare`` exits with a non-zero status if any benchmark got
+slower (or, for memory, larger) than the threshold allows.
+"""
+
+import argparse
+from itertools import chain
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# benchmark the checkout, even if another version is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from six import text_type, binary_type
+
+import data
+from data import Data
+from data.decorators import annotate, auto_instantiate, data as data_arg
+
+
+SIZES = {
+    'small': [16, 4 * 1024, 1024 * 1024],
+    'default': [16, 4 * 1024, 1024 * 1024, 32 * 1024 * 1024],
+    'large': [16, 4 * 1024, 1024 * 1024, 32 * 1024 * 1024,
+              1024 * 1024 * 1024],
+}
+
+BACKINGS = ['bytes', 'text', 'file', 'filename']
+
+
+def make_payload(size):
+    line = u'a line of text with some \xfcnicode in it\n'
+    text = line * (size // len(line.encode('utf8')) + 1)
+    buf = text.encode('utf8')[:size]
+    # do not cut a multi-byte character in half
+    return buf.decode('utf8', 'ignore').encode('utf8')
+
+
+class Fixture(object):
+    def __init__(self, tmpdir, size):
+        self.payload = make_payload(size)
+        self.text = self.payload.decode('utf8')
+        self.filename = os.path.join(tmpdir, 'payload-{}'.format(size))
+        self.dest = os.path.join(tmpdir, 'dest')
+
+        with open(self.filename, 'wb') as f:
+            f.write(self.payload)
+
+    def make(self, backing):
+        if backing == 'bytes':
+            return Data(self.payload)
+        if backing == 'text':
+            return Data(self.text)
+        if backing == 'file':
+            return Data(open(self.filename, 'rb'))
+        if backing == 'filename':
+            return Data(file=self.filename)
+        raise ValueError(backing)
+
+
+def op_construct(d):
+    pass
+
+
+def op_bytes(d):
+    binary_type(d)
+
+
+def op_unicode(d):
+    text_type(d)
+
+
+def op_read_chunks(d):
+    for _ in d.iter_text_chunks():
+        pass
+
+
+def op_readline(d):
+    for _ in iter(d.readline, u''):
+        pass
+
+
+def op_iterate(d):
+    for _ in d:
+        pass
+
+
+def op_save_to(d, fixture):
+    d.save_to(fixture.dest)
+
+
+OPERATIONS = [
+    ('construct', op_construct),
+    ('bytes', op_bytes),
+    ('unicode', op_unicode),
+    ('read_chunks', op_read_chunks),
+    ('readline', op_readline),
+    ('iterate', op_iterate),
+    ('save_to', op_save_to),
+]
+
+
+def measure(func, min_time, max_repeat=1000000):
+    # runs func until min_time has passed, returns the best time per call
+    best = None
+    total = 0.0
+    repeat = 0
+    while (total < min_time or repeat < 3) and repeat < max_repeat:
+        start = default_timer()
+        func()
+        elapsed = default_timer() - start
+
+        total += elapsed
+        repeat += 1
+        best = elapsed if best is None else min(best, elapsed)
+    return best, repeat
+
+
+def data_benchmarks(sizes, min_time, tmpdir, operations):
+    for size in sizes:
+        fixture = Fixture(tmpdir, size)
+
+        for backing in BACKINGS:
+            for name, op in OPERATIONS:
+                if operations and name not in operations:
+                    continue
+
+                # skip line-by-line reads of huge payloads
+                if name == 'readline' and size > 32 * 1024 * 1024:
+                    continue
+
+                def run():
+                    with fixture.make(backing) as d:
+                        if op is op_save_to:
+                            op(d, fixture)
+                        else:
+                            op(d)
+
+                best, repeat = measure(run, min_time)
+                yield {
+                    'name': '{}/{}/{}'.format(name, backing, size),
+                    'seconds': best,
+                    'repeat': repeat,
+                    'bytes': size,
+                }
+
+
+def reference_benchmarks(sizes, min_time, tmpdir):
+    # plain userspace copies, to compare save_to/filename against
+    for size in sizes:
+        fixture = Fixture(tmpdir, size)
+
+        def run():
+            with open(fixture.filename, 'rb') as f,\
+                    open(fixture.dest, 'wb') as out:
+                shutil.copyfileobj(f, out)
+
+        best, repeat = measure(run, min_time)
+        yield {
+            'name': 'reference/copyfileobj/{}'.format(size),
+            'seconds': best,
+            'repeat': repeat,
+            'bytes': size,
+        }
+
+
+def plain(a, b, c=None):
+    return a
+
+
+@auto_instantiate(int)
+@annotate(a=int)
+def instantiated(a, b, c=None):
+    return a
+
+
+@data_arg('a')
+def with_data(a, b, c=None):
+    return a
+
+
+def explicit_data(a, b, c=None):
+    return Data(a)
+
+
+def decorator_benchmarks(min_time):
+    calls = 10000
+    cases = [
+        ('undecorated', lambda: plain(1, 2)),
+        ('auto_instantiate', lambda: instantiated(1, 2)),
+        ('explicit_data', lambda: explicit_data(b'x', 2)),
+        ('data', lambda: with_data(b'x', 2)),
+    ]
+
+    for name, func in cases:
+        def run():
+            for _ in range(calls):
+                func()
+
+        best, repeat = measure(run, min_time)
+        yield {
+            'name': 'decorator/{}'.format(name),
+            'seconds': best / calls,
+            'repeat': repeat * calls,
+        }
+
+
+def memory_benchmarks(count=100000):
+    cases = [
+        ('bytes', lambda i: u'payload {}'.format(i).encode('ascii')),
+        ('text', lambda i: u'payload {}'.format(i)),
+        ('move_constructor',
+         lambda i: Data(u'payload {}'.format(i).encode('ascii'))),
+    ]
+
+    for name, make in cases:
+        payloads = [make(i) for i in range(count)]
+
+        tracemalloc.start()
+        start, _ = tracemalloc.get_traced_memory()
+        instances = [Data(p) for p in payloads]
+        end, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        del instances
+        yield {
+            'name': 'memory/{}'.format(name),
+            'memory': (end - start) / float(count),
+        }
+
+
+def _value(result):
+    # timings are compared by seconds, memory benchmarks by bytes
+    return result['seconds'] if 'seconds' in result else result['memory']
+
+
+def run_suite(args):
+    tmpdir = tempfile.mkdtemp(dir=args.dir)
+    results = []
+    try:
+        benchmarks = [decorator_benchmarks(args.min_time)]
+        if not args.decorators_only:
+            if tracemalloc is not None:
+                benchmarks.append(memory_benchmarks())
+            benchmarks.append(data_benchmarks(
+                SIZES[args.sizes], args.min_time, tmpdir, args.operation))
+            if not args.operation or 'save_to' in args.operation:
+                benchmarks.append(reference_benchmarks(
+                    SIZES[args.sizes], args.min_time, tmpdir))
+        benchmarks = chain.from_iterable(benchmarks)
+
+        for result in benchmarks:
+            if not args.quiet:
+                if 'seconds' in result:
+                    line = '{name:>40}: {seconds:.9f}s\n'
+                else:
+                    line = '{name:>40}: {memory:.1f} bytes/instance\n'
+                sys.stderr.write(line.format(**result))
+            results.append(result)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return {
+        'version': data.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    # prints a comparison and returns the names of regressed benchmarks
+    old = dict((r['name'], _value(r)) for r in baseline['results'])
+    regressions = []
+
+    print('{:>40} {:>12} {:>12} {:>8}'.format(
+        'benchmark', baseline['version'], current['version'], 'ratio'))
+    for result in current['results']:
+        name = result['name']
+        if name not in old or not old[name]:
+            continue
+
+        ratio = _value(result) / old[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = ' SLOWER'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = ' faster'
+
+        print('{:>40} {:>12.6g} {:>12.6g} {:>8.2f}{}'.format(
+            name, old[name], _value(result), ratio, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-o', '--output',
+                        help='write results as JSON to this file')
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+                        help='compare against results from an earlier run')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='relative slowdown that counts as a regression '
+                             '(default: %(default)s)')
+    parser.add_argument('-s', '--sizes', choices=sorted(SIZES),
+                        default='default', help='set of payload sizes')
+    parser.add_argument('--op', dest='operation', action='append',
+                        choices=[name for name, _ in OPERATIONS],
+                        help='only run this operation (repeatable)')
+    parser.add_argument('--decorators-only', action='store_true')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum time spent on each benchmark')
+    parser.add_argument('--dir', help='directory for temporary files')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    current = run_suite(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    elif not args.compare:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        if compare(baseline, current, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
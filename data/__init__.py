@@ -1,29 +1,156 @@
 __version__ = '0.5.dev1'
 
+import codecs
+from collections import deque
 from contextlib import contextmanager
+import errno
+import gzip
 from functools import partial
+import hashlib
+import io
+import mmap
 import os
-from shutil import copyfileobj
+import sys
+from stat import S_ISREG
 import tempfile
+from timeit import default_timer
+import weakref
 
-from six import text_type, PY2, reraise, StringIO, BytesIO, Iterator, wraps
+from six import text_type, PY2, reraise, StringIO, BytesIO
 
+from . import metrics
+from .cache import ContentCache
+from .lineindex import LineIndex
+from . import lineindex
+from .fileops import copy_fd, os_fd, pread, reflink, byte_view, BufferReader,\
+    PrefixedReader, TeeBuffer, TemporaryFile
 
-def enable_unicode(enabled):
-    def wrapper(f):
-        @wraps(f)
-        def _(self, *args, **kwargs):
-            rv = f(self, *args, **kwargs)
-            if enabled and not isinstance(rv, text_type):
-                return rv.decode(self.encoding)
-            elif not enabled and isinstance(rv, text_type):
-                return rv.encode(self.encoding)
-            return rv
-        return _
-    return wrapper
+#: Decompressors available for the ``decompress`` argument of
+#: :class:`~data.Data`, keyed by name.
+DECOMPRESSORS = {'gzip': gzip.open}
 
+try:
+    import bz2
+    DECOMPRESSORS['bz2'] = bz2.open
+except (ImportError, AttributeError):
+    pass
 
-class Data(Iterator):
+try:
+    import lzma
+    DECOMPRESSORS['xz'] = lzma.open
+except ImportError:
+    pass
+
+_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+_MAGIC_SIZE = max(len(magic) for magic, _ in _MAGIC)
+
+
+def _sniff_compression(head):
+    # returns the name of the decompressor for data starting with head
+    for magic, name in _MAGIC:
+        if head.startswith(magic) and name in DECOMPRESSORS:
+            return name
+    return ''
+
+
+# codecs (by their codecs.lookup() name) that encode every character they
+# support to a single byte, without adding anything else
+_SINGLE_BYTE_CODECS = frozenset(['ascii', 'iso8859-1', 'iso8859-15',
+                                 'cp1252'])
+
+# UTF-32 before UTF-16, their little-endian BOMs share a prefix
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def _sniff_encoding(head, complete, fallback):
+    # returns the encoding of data starting with head. complete signals that
+    # head is all there is, otherwise it may end in a truncated character
+    for bom, name in _BOMS:
+        if head.startswith(bom):
+            return name
+
+    try:
+        codecs.getincrementaldecoder('utf8')().decode(head, complete)
+    except UnicodeDecodeError:
+        return fallback
+    return 'utf8'
+
+
+def _unlink(name):
+    try:
+        os.unlink(name)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            reraise(e)
+
+
+def _transient(file):
+    # returns True for file-likes that cannot be read again, like pipes or
+    # sockets. regular and seekable files are not transient
+    try:
+        if S_ISREG(os.fstat(file.fileno()).st_mode):
+            return False
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+
+    try:
+        return not file.seekable()
+    except (AttributeError, IOError, OSError, ValueError):
+        return True
+
+
+def _copy_stream(src, dest, buffer_size):
+    # like shutil.copyfileobj, but returns the number of bytes copied
+    copied = 0
+    while True:
+        buf = src.read(buffer_size)
+        if not buf:
+            return copied
+        dest.write(buf)
+        copied += len(buf)
+
+
+def _copy_file(src, dest, buffer_size):
+    # copies the remainder of src to dest, letting the kernel do the work if
+    # both are plain OS files. returns the name of the method used and the
+    # number of bytes copied
+    src_fd, dst_fd = os_fd(src), os_fd(dest)
+    if src_fd is not None and dst_fd is not None:
+        try:
+            src_pos = src.tell()
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            dest.flush()
+            try:
+                dst_pos = dest.tell()
+            except (IOError, OSError, ValueError):
+                # not seekable, e.g. a pipe or socket
+                dst_pos = None
+
+            method, copied = copy_fd(src_fd, dst_fd, src_pos, dst_pos,
+                                     buffer_size)
+
+            # the buffered file objects are not aware of the fd positions
+            src.seek(src_pos + copied)
+            if dst_pos is not None:
+                dest.seek(dst_pos + copied)
+            return method, copied
+
+    return 'stream', _copy_stream(src, dest, buffer_size)
+
+
+class Data(object):
     """Dynamically converts between various forms of passed in input data.
 
     Exactly one of ``arg``, ``data`` or ``file`` must be not-``None``.
@@ -35,29 +162,122 @@ class Data(Iterator):
                 unusable.
     :param encoding: The data's encoding. Will be used for every conversion
                      from bytestrings to text (unicode) if necessary and the
-                     other way around.
+                     other way around. If ``'auto'``, the encoding is
+                     detected from the first :attr:`~data.Data.sniff_size`
+                     bytes when it is first needed: a byte order mark
+                     selects UTF-8, UTF-16 or UTF-32, otherwise valid
+                     UTF-8 is assumed to be UTF-8 and anything else to be
+                     :attr:`~data.Data.fallback_encoding`.
     :param data: Buffer argument. If unicode string, will be interpreted as
-                 text, otherwise as bytestring.
+                 text, otherwise as bytestring. Other objects supporting the
+                 buffer protocol (e.g. :class:`bytearray`,
+                 :class:`memoryview` or :mod:`array`) are used without
+                 copying them.
     :param file: File argument. Any object with a ``read()`` method will be
                  treated as file-like. Everything else is considered a
-                 filename."""
-    data = None
-    text = None
-    file = None
-    filename = None
-
-    def __init__(self, arg=None, encoding=None, data=None, file=None):
-        self.orig_args = (arg, data, file, encoding)
+                 filename.
+    :param memo_limit: Overrides :attr:`~data.Data.memo_limit` for this
+                       instance.
+    :param decompress: If ``'auto'``, binary data compressed with one of the
+                       formats in :data:`~data.DECOMPRESSORS` is detected by
+                       its magic bytes and decompressed transparently while
+                       reading. Can also be the name of a format to always
+                       decompress.
+    :param spool_threshold: Overrides :attr:`~data.Data.spool_threshold` for
+                            this instance."""
+    __slots__ = ('data', 'text', 'file', 'filename', '_encoding', 'orig_args',
+                 'decompress', '_stream', '_decoder', '_pending', '_codec',
+                 '_mmap', '_memo_limit', '_memo_bytes', '_memo_text',
+                 '_spool_threshold', '_spilled', '_line_index',
+                 '__weakref__')
+
+    #: If ``True``, new instances keep the arguments they were constructed
+    #: with as ``orig_args``. Useful for debugging, but keeps references to
+    #: the arguments alive.
+    debug = False
+
+    #: Default chunk size used when iterating over or copying data.
+    buffer_size = 64 * 1024
+
+    #: Files at least this large are decoded straight from a memory map
+    #: instead of being read into memory first.
+    mmap_threshold = 1024 * 1024
+
+    #: Conversion results of up to this many bytes are kept on the instance,
+    #: making repeated conversions cheap. ``0`` disables memoization. Can
+    #: be overridden per instance using the ``memo_limit`` argument.
+    memo_limit = 0
+
+    #: A :class:`~data.cache.ContentCache` shared by all instances for the
+    #: contents of files passed in by filename. Disabled if ``None``.
+    content_cache = None
+
+    #: A :class:`~data.cache.ContentCache` for the results of
+    #: :meth:`~data.Data.digest` on data passed in by filename. Disabled if
+    #: ``None``.
+    digest_cache = ContentCache(max_bytes=1024 * 1024)
+
+    #: Number of bytes inspected to detect the encoding if it is ``'auto'``.
+    sniff_size = 4 * 1024
+
+    #: Encoding assumed by ``encoding='auto'`` for data that is not valid
+    #: UTF-8 and has no byte order mark.
+    fallback_encoding = 'latin1'
+
+    #: If not ``None``, file-likes that cannot be read again (neither
+    #: regular files nor seekable) are spooled (see
+    #: :meth:`~data.Data.spool`) before they are first read, keeping up to
+    #: this many bytes in memory.
+    #: Can be overridden per instance using the ``spool_threshold``
+    #: argument.
+    spool_threshold = None
+
+    #: If ``True``, line indexes of files (see
+    #: :meth:`~data.Data.line_index`) are saved next to the file and reused
+    #: by later instances.
+    persist_line_index = False
+
+    def __init__(self, arg=None, encoding=None, data=None, file=None,
+                 memo_limit=None, decompress=None, spool_threshold=None):
+        if self.debug:
+            self.orig_args = (arg, data, file, encoding)
         if [arg, data, file].count(None) != 2:
             raise ValueError('Must supply exactly one of data or file')
+        if decompress and decompress != 'auto' and\
+                decompress not in DECOMPRESSORS:
+            raise ValueError('Unknown compression: {!r}'.format(decompress))
+
+        self.data = self.text = self.file = self.filename = None
+        self._stream = self._decoder = self._pending = self._mmap = None
+        self._codec = None
+        self._memo_bytes = self._memo_text = None
+        self._memo_limit = self.memo_limit if memo_limit is None\
+            else memo_limit
+        self._spool_threshold = self.spool_threshold\
+            if spool_threshold is None else spool_threshold
+        self._spilled = None
+        self._line_index = None
 
         # when given a positional argument, try to be smart
         if arg is not None:
             if isinstance(arg, self.__class__):
                 # copy attributes
-                data = arg.data or arg.text
-                file = arg.file or arg.filename
-                encoding = arg.encoding
+                data = arg.data if arg.data is not None else arg.text
+                file = arg.file if arg.file is not None else arg.filename
+                encoding = arg._encoding
+                if decompress is None:
+                    decompress = arg.decompress
+                # a spilled file is deleted by its owner
+                if arg._spilled is not None:
+                    if hasattr(arg._spilled, 'detach'):
+                        arg._spilled.detach()
+                    arg._spilled = None
+                    self._delete_with_self(arg.filename)
+                # so do the stream and whatever has been read ahead from it,
+                # keeping the read position
+                self._stream, self._pending = arg._stream, arg._pending
+                self._decoder, self._codec = arg._decoder, arg._codec
+                arg._stream = arg._pending = arg._decoder = None
                 arg.data = arg.text = arg.file = arg.filename = None
             elif hasattr(arg, 'read'):
                 file = arg
@@ -78,23 +298,35 @@ class Data(Iterator):
                 self.filename = file
 
         self.encoding = encoding or 'utf8'
+        self.decompress = decompress
 
     def __bytes__(self):
         """Returns the data as bytes (on Python3) or string (on Python2)."""
-        if self.data is not None:
-            return self.data
+        if self.data is not None and not self._compression():
+            if isinstance(self.data, bytes):
+                return self.data
+            return byte_view(self.data).tobytes()
 
-        if self.text is not None:
-            return self.text.encode(self.encoding)
+        if self._memo_bytes is not None:
+            return self._memo_bytes
 
-        if self.file is not None:
-            return self.readb()
+        if self.text is not None:
+            rv = self._encode(self.text)
+        elif self.file is not None:
+            rv = self.readb()
+        elif self.filename is not None:
+            rv = self._cached(None, self._read_all)
+        elif self.data is not None:
+            rv = self._read_all()
+        else:
+            raise ValueError('Broken Data, all None.')
 
-        if self.filename is not None:
-            with open(self.filename, 'rb') as f:
-                return f.read()
+        if metrics.hooks:
+            self._emit('materialize', 1, type='bytes')
 
-        raise ValueError('Broken Data, all None.')
+        if self._memo_fits(rv):
+            self._memo_bytes = rv
+        return rv
 
     def __enter__(self):
         """Context manager support. If data is a file-like, will close it upon
@@ -104,17 +336,46 @@ class Data(Iterator):
     def __exit__(self, exception_type, exception_value, traceback):
         self.close()
 
+    def __len__(self):
+        """Returns the size of the data in bytes, see
+        :attr:`~data.Data.size`. Raises :exc:`TypeError` if the size is
+        unknown."""
+        size = self.size
+        if size is None:
+            raise TypeError('Size of {!r} is unknown'.format(self))
+        return size
+
+    def __bool__(self):
+        # instances are true even if empty, like file objects
+        return True
+
+    __nonzero__ = __bool__
+
     def __iter__(self):
-        """Iterator support. Returns lines (similar to file objects) using
-        :meth:`~data.Data.readline`."""
-        return self
+        """Iterator support. Returns lines (similar to file objects), see
+        :meth:`~data.Data.iter_lines`."""
+        return self.iter_lines()
 
     def __next__(self):
-        chunk = self.readline()
+        chunk = self._next_line(False, self.buffer_size)
         if not chunk:
             raise StopIteration
         return chunk
 
+    # not inherited from six.Iterator, which would give instances a __dict__
+    # on Python 2
+    if PY2:
+        next = __next__
+
+    def __aiter__(self):
+        """Asynchronous iterator support. Returns lines like
+        :meth:`~data.Data.__iter__`, without blocking the event loop."""
+        return self
+
+    def __anext__(self):
+        from . import aio
+        return aio.anext(self)
+
     def __str__(self):
         """Returns the data as unicode (on Python3) or string (on Python2)."""
         if PY2:
@@ -126,10 +387,27 @@ class Data(Iterator):
         if self.text is not None:
             return self.text
 
-        if self.file is not None:
-            return self.read()
+        if self._memo_text is not None:
+            return self._memo_text
 
-        return self.__bytes__().decode(self.encoding)
+        if self._memo_bytes is not None:
+            rv = self._decode_all(self._memo_bytes)
+        elif self.file is not None:
+            rv = self.read()
+        elif self.filename is not None:
+            rv = self._cached(self.encoding, self._decode_file)
+        elif self.data is not None and not self._compression():
+            # decode buffers in place, without copying them to bytes first
+            rv = self._decode_all(byte_view(self.data))
+        else:
+            rv = self._decode_all(self.__bytes__())
+
+        if metrics.hooks:
+            self._emit('materialize', 1, type='text')
+
+        if self._memo_fits(rv):
+            self._memo_text = rv
+        return rv
 
     def __repr__(self):
         def head(buf):
@@ -142,102 +420,1208 @@ class Data(Iterator):
 
         if self.data is not None:
             return '{}(data={}, encoding={!r})'.format(
-                cname, head(self.data), self.encoding,
+                cname, head(self.data), self._encoding,
             )
 
         if self.text is not None:
             return '{}(data={}, encoding={!r})'.format(
-                cname, head(self.text), self.encoding,
+                cname, head(self.text), self._encoding,
             )
 
         return '{}(file={!r}, encoding={!r})'.format(
-            cname, self.file or self.filename, self.encoding,
+            cname, self.file or self.filename, self._encoding,
         )
 
+    def _memo_fits(self, value):
+        # checks whether value can be memoized without exceeding the limit
+        if not self._memo_limit:
+            return False
+
+        used = sum(sys.getsizeof(v) for v in (self._memo_bytes,
+                                              self._memo_text)
+                   if v is not None)
+        return used + sys.getsizeof(value) <= self._memo_limit
+
+    def materialize(self):
+        """Load the data into memory.
+
+        Afterwards, conversions using :meth:`~data.Data.__bytes__` and
+        :meth:`~data.Data.__unicode__` are kept on the instance regardless of
+        :attr:`~data.Data.memo_limit`, so repeated conversions do not touch
+        the underlying file again.
+
+        If the data is a file-like, its remaining contents are read and
+        subsequent reads are served from memory, starting at the current
+        position.
+
+        :return: The instance itself."""
+        self._memo_limit = sys.maxsize
+
+        if self.data is None and self.text is None:
+            if self.file is not None and self._memo_bytes is None:
+                self._memo_bytes = self.readb()
+                self._stream = BytesIO(self._memo_bytes)
+            else:
+                self.__bytes__()
+        return self
+
+    def _cached(self, encoding, load):
+        # looks up the file's contents in the shared cache, loading and
+        # storing them if necessary
+        # decompressed contents are not cached, as they do not match the file
+        cache = self.content_cache if not self._compression() else None
+        key = cache.key(self.filename, encoding) if cache is not None\
+            else None
+
+        if key is None:
+            return load()
+
+        rv = cache.get(key)
+        if rv is None:
+            rv = load()
+            cache.put(key, rv)
+        return rv
+
+    @property
+    def encoding(self):
+        """The data's encoding. If ``'auto'`` was passed in, accessing it
+        detects the encoding, see :class:`~data.Data`."""
+        if self._encoding == 'auto':
+            self._encoding = self._detect_encoding()
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value):
+        self._encoding = value
+
+    def _detect_encoding(self):
+        # text can always be encoded as UTF-8
+        if self.text is not None:
+            return 'utf8'
+
+        if self.data is not None and not self._compression():
+            view = byte_view(self.data)
+            return _sniff_encoding(view[:self.sniff_size].tobytes(),
+                                   len(view) <= self.sniff_size,
+                                   self.fallback_encoding)
+
+        if self.file is None:
+            # filenames and buffers can be read again, without keeping the
+            # file open
+            with self._open() as f:
+                head = f.read(self.sniff_size)
+        else:
+            # read the prefix from the stream and push it back, so it is not
+            # read twice. this happens before anything else is read, see
+            # _pop_pending
+            head = self.stream.read(self.sniff_size)
+            if head:
+                self._pending = deque([head])
+
+        if isinstance(head, text_type):
+            return 'utf8'
+        return _sniff_encoding(head, len(head) < self.sniff_size,
+                               self.fallback_encoding)
+
+    def _compression(self):
+        # returns the name of the decompressor to use or an empty string,
+        # detecting the compression if necessary
+        if self._codec is None:
+            if not self.decompress or self.text is not None:
+                self._codec = ''
+            elif self.decompress != 'auto':
+                self._codec = self.decompress
+            elif self.filename is not None:
+                with open(self.filename, 'rb') as f:
+                    self._codec = _sniff_compression(f.read(_MAGIC_SIZE))
+            elif self.data is not None:
+                self._codec = _sniff_compression(
+                    byte_view(self.data)[:_MAGIC_SIZE].tobytes())
+            else:
+                # file-likes are checked when the stream is opened
+                self.stream
+        return self._codec
+
+    def _open(self):
+        # opens a new binary file object on the contents of a filename or
+        # buffer, decompressing them if necessary
+        if self.filename is not None:
+            src = self.filename
+        elif isinstance(self.data, bytes):
+            # BytesIO shares the bytestring's memory until written to
+            src = BytesIO(self.data)
+        else:
+            src = BufferReader(self.data)
+
+        codec = self._compression()
+        if codec:
+            return DECOMPRESSORS[codec](src, 'rb')
+        return open(src, 'rb') if self.filename is not None else src
+
+    def _open_file(self, file):
+        # returns the stream for a file-like, decompressing it if necessary
+        if not self.decompress or getattr(file, 'encoding', None):
+            self._codec = ''
+            return file
+
+        if self.decompress != 'auto':
+            self._codec = self.decompress
+            return DECOMPRESSORS[self._codec](file, 'rb')
+
+        head = file.read(_MAGIC_SIZE)
+        self._codec = _sniff_compression(head)
+
+        # put back what has been read for sniffing
+        try:
+            file.seek(-len(head), os.SEEK_CUR)
+            raw = file
+        except (AttributeError, IOError, OSError, ValueError):
+            raw = PrefixedReader(head, file)
+
+        if self._codec:
+            return DECOMPRESSORS[self._codec](raw, 'rb')
+        return raw
+
+    def _read_all(self):
+        if self.filename is not None and not self._compression():
+            # unbuffered reads of a whole file are sized using fstat, read
+            # straight into the result and not copied through a buffer
+            with open(self.filename, 'rb', buffering=0) as f:
+                rv = f.read()
+        else:
+            with self._open() as f:
+                rv = f.read()
+
+        if metrics.hooks:
+            self._emit('bytes_read', len(rv))
+        return rv
+
+    def _decode_file(self):
+        mm = self._map(self.mmap_threshold) if not self._compression()\
+            else None
+        if mm is not None:
+            try:
+                if metrics.hooks:
+                    self._emit('bytes_read', len(mm))
+                return self._decode_all(mm)
+            finally:
+                mm.close()
+
+        return self._decode_all(self.__bytes__())
+
+    def _backing(self):
+        if self.data is not None:
+            return 'bytes'
+        if self.text is not None:
+            return 'text'
+        if self.file is not None:
+            return 'file'
+        return 'filename'
+
+    def _emit(self, event, value, **tags):
+        tags['backing'] = self._backing()
+        metrics.emit(event, value, tags)
+
+    def _encode(self, text):
+        if not metrics.hooks:
+            return text.encode(self.encoding)
+
+        start = default_timer()
+        rv = text.encode(self.encoding)
+        self._emit('encode_seconds', default_timer() - start)
+        return rv
+
+    def _decode_all(self, buf):
+        if not metrics.hooks:
+            return codecs.decode(buf, self.encoding)
+
+        start = default_timer()
+        rv = codecs.decode(buf, self.encoding)
+        self._emit('decode_seconds', default_timer() - start)
+        return rv
+
+    def _map(self, min_size=1):
+        # returns a read-only memory map of the file, or None if the file is
+        # not a regular file of at least min_size bytes
+        with open(self.filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if not S_ISREG(st.st_mode) or st.st_size < max(min_size, 1):
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
     def close(self):
         """Closes input if based on open filelike. Otherwise does nothing."""
-        # only close if we have something to close
-        if getattr(self, '_stream', None) is None and self.file is None:
-            return
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # views are still in use, the map is released along with them
+                pass
+            self._mmap = None
+
+        if self._spilled is not None:
+            self._spilled()
+            self._spilled = None
+
+        if self._stream is not None:
+            self._stream.close()
+
+        # the stream may have been replaced after materializing
+        if self.file is not None and self.file is not self._stream:
+            self.file.close()
+
+    def spool(self, max_size=1024 * 1024, dir=None):
+        """Reads the rest of a file-like, so the data no longer depends on
+        it. Up to ``max_size`` bytes are kept in memory, larger data is
+        written to a temporary file instead, which is deleted when the
+        instance is closed or garbage collected.
+
+        Afterwards, the data is backed by bytes or a filename, so all
+        operations are supported, including random access and reading it
+        more than once, and :meth:`~data.Data.temp_saved` can hand out the
+        temporary file without copying it again. The file-like is closed.
+        Does nothing for data that is not a file-like.
+
+        :param max_size: Maximum number of bytes kept in memory.
+        :param dir: Directory for the temporary file.
+        :return: The instance itself."""
+        if self.file is None:
+            return self
+
+        # reading through the stream takes care of decompression and text
+        if self._stream is None:
+            self._stream = self._open_file(self.file)
+
+        chunks = []
+        size = 0
+        tmp = None
+        try:
+            for chunk in self.iter_byte_chunks():
+                size += len(chunk)
+                if tmp is None and size > max_size:
+                    tmp = tempfile.NamedTemporaryFile(
+                        prefix='spool', dir=dir, delete=False)
+                    tmp.writelines(chunks)
+                    chunks = None
 
-        self.stream.close()
+                if tmp is None:
+                    chunks.append(chunk)
+                else:
+                    tmp.write(chunk)
+            if tmp is not None:
+                tmp.close()
+        except:
+            if tmp is not None:
+                tmp.close()
+                _unlink(tmp.name)
+            raise
+
+        self.close()
+        self.file = self._stream = self._decoder = self._pending = None
+        self._memo_bytes = self._memo_text = None
+        self.decompress = None
+        self._codec = ''
+
+        if tmp is None:
+            self.data = b''.join(chunks)
+        else:
+            self.filename = tmp.name
+            self._delete_with_self(tmp.name)
+
+        if metrics.hooks:
+            self._emit('spool', 1, spilled=tmp is not None)
+        return self
+
+    def _delete_with_self(self, name):
+        # the file is deleted when the instance is closed or collected
+        finalize = getattr(weakref, 'finalize', None)
+        self._spilled = finalize(self, _unlink, name)\
+            if finalize is not None else partial(_unlink, name)
+
+    def read_range(self, offset, length=None):
+        """Read a range of bytes, without reading everything before it.
+
+        Files are read using :func:`~data.fileops.pread`, so the position
+        of :attr:`~data.Data.stream` is not changed. For file-likes, offsets
+        are relative to the start of the file, not the current position.
+        Compressed data has to be decompressed up to ``offset``.
+
+        :param offset: Offset of the first byte to read.
+        :param length: Maximum number of bytes to read. If ``None``, read
+                       until the end.
+        :return: The bytes in the range. Shorter than ``length`` if the
+                 range extends past the end of the data."""
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError('offset and length must not be negative')
+        end = None if length is None else offset + length
+
+        # memoized contents of file-likes start at an arbitrary position
+        if self._memo_bytes is not None and self.file is None:
+            return self._memo_bytes[offset:end]
+
+        if self.text is not None:
+            return self.__bytes__()[offset:end]
+
+        codec = self._compression()
+        if codec:
+            if self.file is not None:
+                raise ValueError('Random access to compressed file-likes '
+                                 'is not supported.')
+            with self._open() as f:
+                f.seek(offset)
+                rv = f.read() if length is None else f.read(length)
+        elif self.data is not None:
+            return byte_view(self.data)[offset:end].tobytes()
+        elif self.filename is not None:
+            fd = os.open(self.filename, os.O_RDONLY)
+            try:
+                rv = pread(fd, offset, length, self.buffer_size)
+            finally:
+                os.close(fd)
+        else:
+            rv = self._read_file_range(offset, length)
+
+        if metrics.hooks:
+            self._emit('bytes_read', len(rv))
+        return rv
+
+    def _read_file_range(self, offset, length):
+        # only plain files are read from their descriptor, wrappers like
+        # GzipFile pass on the descriptor of the compressed file
+        fd = os_fd(self.file)
+        if fd is not None:
+            return pread(fd, offset, length, self.buffer_size)
+
+        # fall back to seeking, restoring the position afterwards
+        seekable = getattr(self.file, 'seekable', None)
+        try:
+            if not hasattr(self.file, 'seek') or\
+                    (seekable is not None and not seekable()):
+                raise IOError('not seekable')
+            pos = self.file.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            raise ValueError('Random access not supported for {!r}'
+                             .format(self.file))
+
+        try:
+            self.file.seek(offset)
+            rv = self.file.read() if length is None else\
+                self.file.read(length)
+        finally:
+            self.file.seek(pos)
+        return rv
+
+    def __getitem__(self, key):
+        """Slicing support, ``d[a:b]`` is the same as
+        ``d.read_range(a, b - a)``. Only slices with a step of 1 are
+        supported. Negative bounds count from the end and require the
+        :attr:`~data.Data.size` to be known."""
+        if not isinstance(key, slice):
+            raise TypeError('Data only supports slicing')
+
+        if key.step not in (None, 1):
+            raise ValueError('Slicing with a step is not supported')
+
+        if self.text is not None:
+            # text is encoded to be sliced anyway, also giving its size
+            return self.__bytes__()[key]
+
+        start, stop = key.start or 0, key.stop
+        if start < 0 or (stop is not None and stop < 0):
+            size = self.size
+            if size is None:
+                raise ValueError('Negative indices are not supported for '
+                                 'data of unknown size')
+            start, stop, _ = key.indices(size)
+
+        length = None if stop is None else max(stop - start, 0)
+        return self.read_range(start, length)
+
+    @property
+    def size(self):
+        """The size of the data in bytes or ``None``, if it cannot be
+        determined without reading the data, e.g. for compressed data or
+        pipes.
+
+        Buffers and files are measured without reading them (the latter
+        using :func:`os.stat`). For file-likes, this is the number of bytes
+        left to read. Text is not encoded to measure it, its size is only
+        known for single-byte encodings and for ASCII text in UTF-8."""
+        if self._compression():
+            if self._memo_bytes is not None and self.file is None:
+                return len(self._memo_bytes)
+            return None
+
+        if self.data is not None:
+            return byte_view(self.data).nbytes
+
+        if self.text is not None:
+            if self._memo_bytes is not None:
+                return len(self._memo_bytes)
+
+            name = codecs.lookup(self.encoding).name
+            if name in _SINGLE_BYTE_CODECS:
+                return len(self.text)
+
+            # utf-8 encodes ascii to a byte per character
+            isascii = getattr(self.text, 'isascii', None)
+            if name == 'utf-8' and isascii is not None and isascii():
+                return len(self.text)
+            return None
+
+        if self.filename is not None:
+            st = os.stat(self.filename)
+            return st.st_size if S_ISREG(st.st_mode) else None
+
+        return self._remaining()
+
+    def _remaining(self):
+        # returns the number of bytes left to read from a file-like or None
+        pending = self._pending
+        if pending and isinstance(pending[0], text_type):
+            return None
+
+        stream = self.stream
+        if isinstance(stream, io.TextIOBase):
+            return None
+
+        # only plain files have the size of their descriptor, wrappers like
+        # GzipFile pass on the descriptor of the compressed file
+        fd = os_fd(stream)
+        if fd is not None:
+            st = os.fstat(fd)
+            if not S_ISREG(st.st_mode):
+                return None
+            end = st.st_size
+        elif hasattr(stream, 'getbuffer'):
+            end = len(stream.getbuffer())
+        else:
+            return None
+
+        try:
+            pos = stream.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+
+        rv = max(end - pos, 0)
+        if pending:
+            rv += sum(len(chunk) for chunk in pending)
+        if self._decoder is not None:
+            rv += len(self._decoder.getstate()[0])
+        return rv
+
+    def view(self):
+        """Returns a :class:`memoryview` of the data as bytes.
+
+        Filename-backed data is memory-mapped, allowing parsers that accept
+        buffers to work on the file contents without copying them onto the
+        heap. The map is kept until :meth:`~data.Data.close` is called.
+        Bytestrings and other buffers are wrapped without copying, all other
+        data is converted using :meth:`~data.Data.__bytes__` first."""
+        if self._compression():
+            return memoryview(self.__bytes__())
+
+        if self.data is not None:
+            return byte_view(self.data)
+
+        if self.filename is not None:
+            if self._mmap is None:
+                self._mmap = self._map()
+            if self._mmap is not None:
+                return memoryview(self._mmap)
+
+        return memoryview(self.__bytes__())
+
+    def digest(self, algorithm='sha256'):
+        """Returns a hash of the data's bytes as a hexadecimal string.
+
+        The data is hashed in chunks or, for large files, from a memory map,
+        so it is never loaded into memory as a whole. Digests of data passed
+        in by filename are kept in :attr:`~data.Data.digest_cache`. The
+        remaining contents of file-likes are consumed.
+
+        :param algorithm: Any name accepted by :func:`hashlib.new`."""
+        cache = self.digest_cache if self.filename is not None else None
+        key = cache.key(self.filename,
+                        ('digest', algorithm, self._compression()))\
+            if cache is not None else None
+
+        rv = cache.get(key) if key is not None else None
+        if rv is None:
+            h = hashlib.new(algorithm)
+            self._hash(h)
+            rv = h.hexdigest()
+
+            if key is not None:
+                cache.put(key, rv)
+        return rv
+
+    def _hash(self, h):
+        if self._memo_bytes is not None and self.file is None:
+            h.update(self._memo_bytes)
+        elif self.text is not None:
+            h.update(self.__bytes__())
+        elif self.file is not None:
+            for chunk in self.iter_byte_chunks():
+                h.update(chunk)
+        elif self._compression():
+            with self._open() as f:
+                for chunk in iter(partial(f.read, self.buffer_size), b''):
+                    h.update(chunk)
+        elif self.data is not None:
+            h.update(byte_view(self.data))
+        else:
+            mm = self._map(self.mmap_threshold)
+            if mm is not None:
+                try:
+                    h.update(mm)
+                finally:
+                    mm.close()
+            else:
+                with open(self.filename, 'rb') as f:
+                    for chunk in iter(partial(f.read, self.buffer_size),
+                                      b''):
+                        h.update(chunk)
+
+    def line_index(self, persist=None):
+        """Returns a :class:`~data.lineindex.LineIndex` of the data's lines,
+        used by :meth:`~data.Data.line` and :meth:`~data.Data.lines`.
+
+        The index is built on first use, by scanning the data in large
+        blocks, and kept on the instance. For data passed in by filename, it
+        is rebuilt once the file's size or modification time changes. Text
+        is indexed by character offsets and sliced directly.
+
+        :param persist: If ``True``, an index saved next to the file is used
+                        if it is up to date, otherwise a new one is saved
+                        (errors while saving are ignored). Defaults to
+                        :attr:`~data.Data.persist_line_index`."""
+        if self.text is None and u'a\n'.encode(self.encoding)[-2:] != b'a\n':
+            raise ValueError('Line indexes require an ASCII-compatible '
+                             'encoding, not {!r}'.format(self.encoding))
+        if self.file is not None:
+            raise ValueError('Line indexes require data that can be read '
+                             'more than once, see spool()')
+
+        if self.filename is None:
+            if self._line_index is None:
+                self._line_index = LineIndex.build(self._blocks())
+            return self._line_index
+
+        st = os.stat(self.filename)
+        stamp = (st.st_size,
+                 getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9)))
+        if self._line_index is not None and self._line_index.stamp == stamp:
+            return self._line_index
+
+        persist = self.persist_line_index if persist is None else persist
+        path = self.filename + lineindex.SUFFIX
+        index = LineIndex.load(path, stamp) if persist else None
+
+        if index is None:
+            index = LineIndex.build(self._blocks(), stamp)
+            if persist:
+                try:
+                    index.save(path)
+                except (IOError, OSError):
+                    pass
+
+        self._line_index = index
+        return index
+
+    def _blocks(self):
+        # yields the data's bytes in blocks for scanning. text is scanned
+        # as it is, so its index counts characters
+        size = lineindex.BLOCK_SIZE
+        if self.text is not None:
+            for i in range(0, len(self.text), size):
+                yield self.text[i:i + size]
+        elif self.data is not None and not self._compression():
+            view = byte_view(self.data)
+            for i in range(0, len(view), size):
+                yield view[i:i + size].tobytes()
+        else:
+            with self._open() as f:
+                for block in iter(partial(f.read, size), b''):
+                    yield block
+
+    def line(self, n):
+        """Returns line ``n`` (counting from ``0``, negative numbers count
+        from the end), including its line ending, without reading the lines
+        before it. See :meth:`~data.Data.line_index`."""
+        index = self.line_index()
+        if n < 0:
+            n += len(index)
+        if not 0 <= n < len(index):
+            raise IndexError('line number out of range')
+
+        return self._read_lines(*index.span(n, n + 1))
+
+    def lines(self, start=0, stop=None):
+        """Returns a list of the lines from ``start`` up to, but not
+        including, ``stop``, like slicing the result of
+        :meth:`~data.Data.readlines`, but reading only the requested lines.
+        See :meth:`~data.Data.line_index`."""
+        offset, length = self.line_index().span(start, stop)
+        if not length:
+            return []
+
+        parts = self._read_lines(offset, length).split(u'\n')
+        tail = parts.pop()
+        rv = [part + u'\n' for part in parts]
+        if tail:
+            rv.append(tail)
+        return rv
+
+    def _read_lines(self, offset, length):
+        # returns the text of a span of the line index
+        if self.text is not None:
+            return self.text[offset:offset + length]
+        return self._decode_all(self.read_range(offset, length))
+
+    def line_count(self):
+        """Returns the number of lines, see :meth:`~data.Data.line_index`.
+        """
+        return len(self.line_index())
+
+    def map_chunks(self, fn, workers=4, executor='thread', align='line',
+                   chunk_size=None, ordered=True):
+        """Splits the data into chunks and calls ``fn`` on each of them in
+        parallel, e.g. to process a large file on all cores:
+
+        .. code-block:: python
+
+           def count_errors(chunk):
+               return sum(1 for line in chunk if 'ERROR' in line)
+
+           total = sum(Data(file='huge.log').map_chunks(
+               count_errors, executor='process'))
+
+        ``fn`` is called with a :class:`~data.Data` instance for each chunk
+        and must not keep references to it. For data passed in by filename,
+        workers map the chunk of the file themselves, only its offset and
+        length are sent to them. Other data is read first and split in
+        memory, chunks are copied to worker processes.
+
+        :param fn: Function to call. Must be picklable (e.g. defined at
+                   module level) when using processes.
+        :param workers: Number of threads or processes.
+        :param executor: ``'thread'``, ``'process'`` or a
+                         :class:`~concurrent.futures.Executor` instance
+                         (not shut down afterwards).
+        :param align: If ``'line'``, chunks end after a newline, so no line
+                      is split. If ``None``, chunks are split anywhere.
+        :param chunk_size: Approximate size of the chunks in bytes. Defaults
+                           to a size that makes four chunks per worker, but
+                           at least 1 MB.
+        :param ordered: If ``True``, results are returned in the order of
+                        the chunks, otherwise as soon as they are done.
+        :return: A generator of the results of ``fn``."""
+        from concurrent.futures import Executor
+
+        # arguments are checked right away, not on the first result
+        if align not in ('line', None):
+            raise ValueError('Unknown alignment: {!r}'.format(align))
+        if not isinstance(executor, Executor) and\
+                executor not in ('thread', 'process'):
+            raise ValueError('Unknown executor: {!r}'.format(executor))
+
+        return self._map_chunks(fn, workers, executor, align, chunk_size,
+                                ordered)
+
+    def _map_chunks(self, fn, workers, executor, align, chunk_size, ordered):
+        from concurrent.futures import Executor, ThreadPoolExecutor,\
+            ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+        if isinstance(executor, Executor):
+            pool, owned = executor, False
+        elif executor == 'thread':
+            pool, owned = ThreadPoolExecutor(max_workers=workers), True
+        else:
+            pool, owned = ProcessPoolExecutor(max_workers=workers), True
+        processes = isinstance(pool, ProcessPoolExecutor)
+
+        encoding = self.encoding
+        if self.filename is not None and not self._compression():
+            size = self.size
+            buf = view = None
+        else:
+            buf = self.__bytes__()
+            view = byte_view(buf)
+            size = len(view)
+
+        if chunk_size is None:
+            chunk_size = max(size // (workers * 4), 1024 * 1024)
+
+        # only a few chunks are submitted ahead of the results, so they are
+        # not all copied to worker processes at once
+        futures = deque()
+        try:
+            for offset, length in self._split(size, chunk_size, align, buf):
+                if view is None:
+                    futures.append(pool.submit(
+                        _map_file_range, fn, self.filename, offset, length,
+                        encoding))
+                else:
+                    chunk = view[offset:offset + length]
+                    futures.append(pool.submit(
+                        _map_buffer, fn,
+                        chunk.tobytes() if processes else chunk, encoding))
+
+                if len(futures) < 2 * workers:
+                    continue
+                if ordered:
+                    yield futures.popleft().result()
+                else:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        futures.remove(future)
+                        yield future.result()
+
+            for future in futures if ordered else as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            if owned:
+                pool.shutdown(wait=True)
+
+    def _split(self, size, chunk_size, align, buf=None):
+        # yields offset and length of consecutive chunks, optionally moving
+        # each chunk's end to just after the next newline. newlines are
+        # searched in buf if given, otherwise in the file
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+
+            # searches include the preceding byte, in case it is a newline
+            if align == 'line' and buf is not None:
+                i = buf.find(b'\n', end - 1)
+                end = i + 1 if i >= 0 else size
+            elif align == 'line':
+                while end < size:
+                    window = self.read_range(end - 1, self.buffer_size)
+                    i = window.find(b'\n')
+                    if i >= 0 or len(window) <= 1:
+                        end = end + i if i >= 0 else size
+                        break
+                    end += len(window) - 1
+
+            yield start, end - start
+            start = end
 
     @property
     def stream(self):
         """Returns a stream object (:func:`file`, :class:`~io.BytesIO` or
         :class:`~StringIO.StringIO`) on the data."""
 
-        if not hasattr(self, '_stream'):
+        if self._stream is None:
+            if self.file is not None and\
+                    self._spool_threshold is not None and\
+                    _transient(self.file):
+                self.spool(self._spool_threshold)
+
             if self.file is not None:
-                self._stream = self.file
-            elif self.filename is not None:
-                self._stream = open(self.filename, 'rb')
+                self._stream = self._open_file(self.file)
             elif self.text is not None:
                 self._stream = StringIO(self.text)
-            elif self.data is not None:
-                self._stream = BytesIO(self.data)
+            elif self.filename is not None or self.data is not None:
+                self._stream = self._open()
             else:
                 raise ValueError('Broken Data, all None.')
         return self._stream
 
-    @enable_unicode(True)
-    def read(self, *args, **kwargs):
+    def _decode(self, chunk, final=False):
+        # decoding is done incrementally, so that multi-byte sequences split
+        # across two reads are reassembled instead of causing errors
+        if isinstance(chunk, text_type):
+            return chunk
+
+        if self._decoder is None:
+            self._decoder = codecs.getincrementaldecoder(self.encoding)()
+
+        if not metrics.hooks:
+            return self._decoder.decode(chunk, final)
+
+        self._emit('bytes_read', len(chunk))
+        start = default_timer()
+        rv = self._decoder.decode(chunk, final)
+        self._emit('decode_seconds', default_timer() - start)
+        return rv
+
+    def _undecoded(self):
+        # returns bytes that have been read but not yet decoded, resetting the
+        # decoder in the process
+        if self._decoder is None:
+            return b''
+
+        buf, _ = self._decoder.getstate()
+        self._decoder.reset()
+        return buf
+
+    def _pop_pending(self, binary):
+        # returns data that has been read ahead from the stream, but not
+        # consumed yet, as bytes or unicode
+        if self._encoding == 'auto':
+            # every read starts here, detect before the stream is touched
+            self.encoding
+
+        pending, self._pending = self._pending, None
+
+        if not pending:
+            return b'' if binary else u''
+
+        if isinstance(pending[0], text_type):
+            buf = u''.join(pending)
+            return self._encode(buf) if binary else buf
+
+        buf = b''.join(pending)
+        return buf if binary else self._decode(buf)
+
+    def _next_line(self, binary, chunk_size):
+        # returns the next line, reading in large blocks and splitting them
+        # into lines all at once. lines not returned yet are kept as pending
+        pending = self._pending
+        if pending and isinstance(pending[0], text_type) != binary:
+            if len(pending) > 1 or pending[0][-1:] in (b'\n', u'\n'):
+                return pending.popleft()
+
+        nl = b'\n' if binary else u'\n'
+        buf = self._pop_pending(binary)
+        while True:
+            chunk = self.readb(chunk_size) if binary else\
+                self.read(chunk_size)
+            if not chunk:
+                return buf
+
+            buf += chunk
+            if nl in chunk:
+                break
+
+        lines = buf.split(nl)
+        tail = lines.pop()
+
+        pending = deque(line + nl for line in lines)
+        if tail:
+            pending.append(tail)
+
+        line = pending.popleft()
+        self._pending = pending or None
+        return line
+
+    def read(self, size=-1):
         """Read method, implements same interface as :func:`file.read`. Always
-        returns ``unicode``."""
-        return self.stream.read(*args, **kwargs)
+        returns ``unicode``.
+
+        When reading from a byte source, ``size`` is the number of bytes read
+        from the underlying stream. Incomplete multi-byte sequences at the end
+        of a chunk are held back until the next call."""
+        buf = self._pop_pending(False)
 
-    @enable_unicode(False)
-    def readb(self, *args, **kwargs):
+        if size is None or size < 0:
+            return buf + self._decode(self.stream.read(), True)
+
+        if buf:
+            if len(buf) > size:
+                self._pending = deque([buf[size:]])
+                return buf[:size]
+            return buf
+
+        while True:
+            chunk = self.stream.read(size)
+            text = self._decode(chunk, not chunk)
+
+            # do not signal EOF if we only got part of a character
+            if text or not chunk:
+                return text
+
+    def readb(self, size=-1):
         """Like :meth:`~data.Data.read`, but returns bytestrings instead."""
-        return self.stream.read(*args, **kwargs)
+        pending = self._pop_pending(True) + self._undecoded()
+
+        if size is None or size < 0:
+            rv = self.stream.read()
+        elif size <= len(pending):
+            if size < len(pending):
+                self._pending = deque([pending[size:]])
+            return pending[:size]
+        else:
+            rv = self.stream.read(size - len(pending))
+
+        if isinstance(rv, text_type):
+            rv = self._encode(rv)
+        elif metrics.hooks:
+            self._emit('bytes_read', len(rv))
+        return pending + rv
+
+    def readinto(self, buf):
+        """Read bytes into a pre-allocated, writable buffer (e.g. a
+        :class:`bytearray` or :class:`memoryview`), like
+        :meth:`io.RawIOBase.readinto`.
+
+        Binary files and buffers are read from directly, without creating
+        intermediate bytestrings.
+
+        :return: The number of bytes read, ``0`` at the end of the data."""
+        dest = byte_view(buf)
+        n = 0
+
+        pending = self._pop_pending(True) + self._undecoded()
+        if pending:
+            n = min(len(pending), len(dest))
+            dest[:n] = pending[:n]
+            if n < len(pending):
+                self._pending = deque([pending[n:]])
+                return n
 
-    @enable_unicode(True)
-    def readline(self, *args, **kwargs):
+        stream = self.stream
+        if hasattr(stream, 'readinto'):
+            got = stream.readinto(dest[n:]) or 0
+            if metrics.hooks:
+                self._emit('bytes_read', got)
+        else:
+            # text may encode to more bytes than requested, keep the rest
+            chunk = self.readb(len(dest) - n)
+            got = min(len(chunk), len(dest) - n)
+            dest[n:n + got] = chunk[:got]
+            if got < len(chunk):
+                self._pending = deque([chunk[got:]])
+        return n + got
+
+    def readline(self, size=-1):
         """Return one line from stream. Always returns unicode."""
-        return self.stream.readline(*args)
+        if size is None:
+            size = -1
+
+        buf = self._pop_pending(False)
+        if buf:
+            end = buf.find(u'\n') + 1 or len(buf)
+            if size >= 0:
+                end = min(end, size)
+
+            if end < len(buf):
+                self._pending = deque([buf[end:]])
+                return buf[:end]
+            if buf.endswith(u'\n') or len(buf) == size:
+                return buf
+
+            # the line continues in the stream
+            return buf + self.readline(size - len(buf) if size >= 0 else -1)
+
+        while True:
+            if size < 0:
+                line = self.stream.readline()
+            else:
+                line = self.stream.readline(size)
+            text = self._decode(line, not line)
+
+            if text or not line:
+                return text
+
+    def iter_lines(self, keepends=True, binary=False, chunk_size=None):
+        """Iterate over lines.
+
+        Instead of reading line by line, large blocks are read and split into
+        lines all at once, which is a lot faster than repeatedly calling
+        :meth:`~data.Data.readline`. Lines that have been read ahead are
+        not lost when iteration stops early, they are returned by subsequent
+        reads.
+
+        :param keepends: If ``False``, strip the trailing newline.
+        :param binary: If ``True``, return bytestrings instead of unicode.
+        :param chunk_size: Size of the blocks to read. Defaults to
+                           :attr:`~data.Data.buffer_size`."""
+        chunk_size = chunk_size or self.buffer_size
+        nl = b'\n' if binary else u'\n'
+
+        while True:
+            line = self._next_line(binary, chunk_size)
+            if not line:
+                return
+
+            if keepends:
+                yield line
+
+                # fast path for lines that have been split already. the last
+                # one may be incomplete, so it is left to _next_line
+                while self._pending is not None and len(self._pending) > 1:
+                    yield self._pending.popleft()
+            else:
+                yield line[:-1] if line.endswith(nl) else line
+
+    def aread(self, size=-1):
+        """Coroutine version of :meth:`~data.Data.read`. File I/O is done in a
+        thread pool (see :mod:`data.aio`)."""
+        from . import aio
+        return aio.aread(self, size)
+
+    def areadb(self, size=-1):
+        """Coroutine version of :meth:`~data.Data.readb`."""
+        from . import aio
+        return aio.areadb(self, size)
+
+    def areadline(self, size=-1):
+        """Coroutine version of :meth:`~data.Data.readline`."""
+        from . import aio
+        return aio.areadline(self, size)
+
+    def iter_byte_chunks(self, size=None):
+        """Iterate over the data in chunks of bytestrings.
+
+        Reads at most ``size`` bytes (defaults to
+        :attr:`~data.Data.buffer_size`) at a time, making it possible to
+        process large inputs with bounded memory.
+
+        :param size: Maximum size of each chunk."""
+        size = size or self.buffer_size
+        return iter(partial(self.readb, size), b'')
+
+    def iter_text_chunks(self, size=None):
+        """Iterate over the data in chunks of unicode.
+
+        Like :meth:`~data.Data.iter_byte_chunks`, but decodes incrementally.
+        Multi-byte characters split across chunk boundaries are never
+        corrupted.
+
+        :param size: Number of bytes read from the source for each chunk."""
+        size = size or self.buffer_size
+        return iter(partial(self.read, size), u'')
 
     def readlines(self, *args, **kwargs):
         """Return list of all lines. Always returns list of unicode."""
         return list(iter(partial(self.readline, *args, **kwargs), u''))
 
-    def save_to(self, file):
+    def save_to(self, file, buffer_size=None, encoding=None,
+                errors='strict', newline=None):
         """Save data to file.
 
-        Will copy by either writing out the data or using
-        :func:`shutil.copyfileobj`.
+        Will copy by either writing out the data or, if the data is backed by
+        a file, by copying it. When both ends are files on the OS level, the
+        copy is done by the kernel (see :func:`~data.fileops.copy_fd`),
+        otherwise it is copied in chunks of ``buffer_size``.
+
+        If the data has to be converted, because it is text or a different
+        ``encoding`` or ``newline`` is requested, it is decoded and encoded
+        incrementally, in chunks of ``buffer_size`` characters, so it never
+        has to be held in memory as a whole.
 
         :param file: A file-like object (with a ``write`` method) or a
-                     filename."""
+                     filename.
+        :param buffer_size: Chunk size used when copying in userspace.
+                            Defaults to :attr:`~data.Data.buffer_size`.
+        :param encoding: Encoding to write the data in. Defaults to the
+                         data's encoding.
+        :param errors: Error handling scheme used for encoding, see
+                       :func:`codecs.encode`.
+        :param newline: If given, newlines (``\\n``) are translated to this
+                        string, e.g. ``'\\r\\n'``."""
         dest = file
+        buffer_size = buffer_size or self.buffer_size
 
         if hasattr(dest, 'write'):
-            # writing to a file-like
-            # only works when no unicode conversion is done
-            if self.file is not None and\
+            # bytes are copied as they are if neither encoding nor newlines
+            # change
+            transcode = newline not in (None, u'\n') or (
+                encoding is not None and codecs.lookup(encoding).name !=
+                codecs.lookup(self.encoding).name)
+
+            if transcode:
+                method = 'transcode'
+                copied = self._transcode(dest, encoding or self.encoding,
+                                         errors, newline, buffer_size)
+            elif self._memo_bytes is None and (
+                    self.text is not None or
+                    getattr(self.file, 'encoding', None) is not None):
+                # text is encoded in chunks instead of all at once
+                method = 'write'
+                copied = self._transcode(dest, self.encoding, errors, None,
+                                         buffer_size)
+            elif self.file is not None and\
                     getattr(self.file, 'encoding', None) is None:
-                copyfileobj(self.file, dest)
+                pending = self._pop_pending(True) + self._undecoded()
+                if pending:
+                    dest.write(pending)
+
+                if self._compression():
+                    method = 'stream'
+                    copied = _copy_stream(self.stream, dest, buffer_size)
+                else:
+                    method, copied = _copy_file(self.stream, dest,
+                                                buffer_size)
+                copied += len(pending)
             elif self.filename is not None:
-                with open(self.filename, 'rb') as inp:
-                    copyfileobj(inp, dest)
+                if self._compression():
+                    with self._open() as inp:
+                        method = 'stream'
+                        copied = _copy_stream(inp, dest, buffer_size)
+                else:
+                    with open(self.filename, 'rb') as inp:
+                        method, copied = _copy_file(inp, dest, buffer_size)
             else:
-                dest.write(self.__bytes__())
+                # buffers are written out as they are, without a copy
+                buf = self.data if self.data is not None and\
+                    not self._compression() else self.__bytes__()
+                dest.write(buf)
+                method, copied = 'write', byte_view(buf).nbytes
+
+            if metrics.hooks:
+                self._emit('save_to', 1, method=method)
+                self._emit('bytes_written', copied)
         else:
             # we do not use filesystem io to make sure we have the same
             # permissions all around
-            # copyfileobj() should be efficient enough
 
             # destination is a filename
             with open(dest, 'wb') as out:
-                return self.save_to(out)
+                return self.save_to(out, buffer_size, encoding, errors,
+                                    newline)
 
-    @contextmanager
-    def temp_saved(self, suffix='', prefix='tmp', dir=None):
-        """Saves data to temporary file and returns the relevant instance of
-        :func:`~tempfile.NamedTemporaryFile`. The resulting file is not
-        deleted upon closing, but when the context manager exits.
+    def _iter_text(self, size):
+        # yields the text in chunks of up to size characters or bytes read.
+        # data that can be read more than once is read independently of the
+        # stream
+        if self.text is not None:
+            for i in range(0, len(self.text), size):
+                yield self.text[i:i + size]
+        elif self.file is not None:
+            for chunk in iter(partial(self.read, size), u''):
+                yield chunk
+        else:
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            with self._open() as f:
+                for chunk in iter(partial(f.read, size), b''):
+                    text = decoder.decode(chunk)
+                    if text:
+                        yield text
+            text = decoder.decode(b'', True)
+            if text:
+                yield text
 
-        Other arguments are passed on to :func:`~tempfile.NamedTemporaryFile`.
-        """
+    def _transcode(self, dest, encoding, errors, newline, buffer_size):
+        # writes the data to dest in another encoding, returns the number of
+        # bytes written
+        encoder = codecs.getincrementalencoder(encoding)(errors)
+        copied = 0
+
+        for text in self._iter_text(buffer_size):
+            if newline is not None:
+                text = text.replace(u'\n', newline)
+            buf = encoder.encode(text)
+            dest.write(buf)
+            copied += len(buf)
+
+        buf = encoder.encode(u'', True)
+        if buf:
+            dest.write(buf)
+            copied += len(buf)
+        return copied
+
+    def asave_to(self, file, buffer_size=None, **kwargs):
+        """Coroutine version of :meth:`~data.Data.save_to`."""
+        from . import aio
+        return aio.asave_to(self, file, buffer_size, **kwargs)
+
+    def _temp_copy(self, suffix, prefix, dir):
         tmp = tempfile.NamedTemporaryFile(
             suffix=suffix,
             prefix=prefix,
@@ -249,10 +1633,328 @@ class Data(Iterator):
             self.save_to(tmp)
             tmp.flush()
             tmp.seek(0)
-            yield tmp
-        finally:
+        except:
+            tmp.close()
+            _unlink(tmp.name)
+            raise
+        return tmp, tmp.name, partial(_unlink, tmp.name)
+
+    def tee(self, n=2, max_memory=1024 * 1024, dir=None):
+        """Returns ``n`` new instances that read the data independently of
+        each other, e.g. to have a validator and a parser consume the same
+        pipe.
+
+        For file-likes, the remaining data is read only once and shared by
+        the new instances. It is kept until each of them has read it,
+        temporarily written to a file in ``dir`` once more than
+        ``max_memory`` bytes would have to be kept in memory. The new
+        instances may be read from different threads. This instance must
+        not be read from anymore, it is closed along with the last of the
+        new instances.
+
+        Data that is not a file-like can be read more than once anyway, the
+        new instances share it without any buffering. Data spooled to a
+        temporary file is only available until this instance is closed.
+
+        :param n: Number of instances.
+        :param max_memory: Maximum number of bytes kept in memory.
+        :param dir: Directory for the temporary file.
+        :return: A list of :class:`~data.Data` instances."""
+        encoding = self.encoding
+
+        if self.file is None:
+            src = self.text if self.text is not None else self.data
+            if src is not None:
+                return [self.__class__(data=src, encoding=encoding,
+                                       decompress=self.decompress)
+                        for _ in range(n)]
+            return [self.__class__(file=self.filename, encoding=encoding,
+                                   decompress=self.decompress)
+                    for _ in range(n)]
+
+        buf = TeeBuffer(self.readb, n, max_memory, self.buffer_size, dir,
+                        on_close=self.close)
+        return [self.__class__(file=reader, encoding=encoding)
+                for reader in buf.readers]
+
+    def _temp_spooled(self, suffix, prefix, dir):
+        if self._spilled is None or not self.filename.endswith(suffix):
+            return None
+
+        # the file is deleted along with the instance
+        return open(self.filename, 'rb'), self.filename, lambda: None
+
+    def _temp_reflink(self, suffix, prefix, dir):
+        if self.filename is None or self._compression():
+            return None
+
+        tmp = tempfile.NamedTemporaryFile(
+            suffix=suffix,
+            prefix=prefix,
+            dir=dir,
+            delete=False,
+        )
+
+        with open(self.filename, 'rb') as src:
+            if reflink(src.fileno(), tmp.fileno()):
+                return tmp, tmp.name, partial(_unlink, tmp.name)
+
+        tmp.close()
+        _unlink(tmp.name)
+
+    def _temp_link(self, suffix, prefix, dir):
+        if self.filename is None or self._compression():
+            return None
+
+        while True:
+            # reserve a unique name, then replace it with the link
+            fd, name = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=dir)
+            os.close(fd)
+            os.unlink(name)
+
             try:
-                os.unlink(tmp.name)
+                os.link(self.filename, name)
             except OSError as e:
-                if e.errno != 2:
-                    reraise(e)
+                if e.errno == errno.EEXIST:
+                    continue
+                if e.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    return None
+                raise
+            return open(name, 'rb'), name, partial(_unlink, name)
+
+    def _temp_memfd(self, suffix, prefix, dir):
+        if not hasattr(os, 'memfd_create') or self.filename is not None or\
+                self.file is not None:
+            return None
+
+        # the original descriptor keeps the file alive, even if the returned
+        # file object is closed
+        fd = os.memfd_create(prefix + suffix)
+        try:
+            tmp = os.fdopen(os.dup(fd), 'w+b')
+            self.save_to(tmp)
+            tmp.flush()
+            tmp.seek(0)
+        except:
+            os.close(fd)
+            raise
+        return (tmp, '/proc/{}/fd/{}'.format(os.getpid(), fd),
+                partial(os.close, fd))
+
+    @contextmanager
+    def temp_saved(self, suffix='', prefix='tmp', dir=None, strategy='copy'):
+        """Saves data to temporary file and returns a file object similar to
+        the ones returned by :func:`~tempfile.NamedTemporaryFile`. The
+        resulting file is not deleted upon closing, but when the context
+        manager exits.
+
+        The ``strategy`` determines how the file is created:
+
+        ``'copy'``
+            Copy the data into a new temporary file.
+        ``'reflink'``
+            Clone a filename-backed file using copy-on-write. Only supported
+            on some filesystems, e.g. btrfs or XFS.
+        ``'link'``
+            Create a hardlink to a filename-backed file. Note that the
+            temporary file shares its contents with the original, any
+            changes made to it will show up in the original as well.
+        ``'memfd'``
+            Create an anonymous in-memory file (Linux only) for data that is
+            not backed by a file. The name of the resulting file is a path
+            inside ``/proc`` that other processes can open.
+        ``'spooled'``
+            Use the temporary file a file-like was spooled to (see
+            :meth:`~data.Data.spool`), without copying it. The file is
+            deleted when the instance is closed, instead of when the context
+            manager exits, and must not be modified.
+        ``'auto'``
+            Use ``'spooled'``, ``'reflink'`` or ``'memfd'`` where possible,
+            fall back to ``'copy'`` otherwise.
+
+        The strategy that was used is available as the ``strategy`` attribute
+        on the returned file.
+
+        Other arguments are passed on to :func:`~tempfile.NamedTemporaryFile`.
+        """
+        if strategy == 'auto':
+            candidates = ['spooled', 'reflink', 'memfd', 'copy']
+        elif strategy in _TEMP_STRATEGIES:
+            candidates = [strategy]
+        else:
+            raise ValueError('Unknown strategy: {!r}'.format(strategy))
+
+        for name in candidates:
+            rv = getattr(self, _TEMP_STRATEGIES[name])(suffix, prefix, dir)
+            if rv is not None:
+                break
+        else:
+            raise ValueError('Strategy {!r} not supported for {!r}'.format(
+                strategy, self))
+
+        tmp, tmpname, cleanup = rv
+        try:
+            yield TemporaryFile(tmp, tmpname, name)
+        finally:
+            # closing the file object releases its descriptor right away,
+            # for memfd also the memory
+            try:
+                tmp.close()
+            finally:
+                cleanup()
+
+    def atemp_saved(self, *args, **kwargs):
+        """Asynchronous context manager version of
+        :meth:`~data.Data.temp_saved`:
+
+        .. code-block:: python
+
+           async with d.atemp_saved() as tmp:
+               await run_tool(tmp.name)
+        """
+        from . import aio
+        return aio.atemp_saved(self, *args, **kwargs)
+
+
+_TEMP_STRATEGIES = {
+    'copy': '_temp_copy',
+    'reflink': '_temp_reflink',
+    'link': '_temp_link',
+    'memfd': '_temp_memfd',
+    'spooled': '_temp_spooled',
+}
+
+
+def digest_many(items, algorithm='sha256', workers=4):
+    """Computes :meth:`~data.Data.digest` for many :class:`~data.Data`
+    instances concurrently, using a pool of threads. :mod:`hashlib` releases
+    the GIL while hashing large buffers, so this speeds up hashing as well
+    as I/O.
+
+    :param items: An iterable of :class:`~data.Data` instances.
+    :param algorithm: Any name accepted by :func:`hashlib.new`.
+    :param workers: Number of threads.
+    :return: A list of digests, in the same order as ``items``."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda d: d.digest(algorithm), items))
+
+
+def load_many(paths, workers=4, max_open_fds=None, max_bytes=None,
+              ordered=True, **kwargs):
+    """Loads many files concurrently, using a pool of threads.
+
+    Contents are read ahead of the consumer, so disk latency is not paid
+    one file at a time. To keep memory use bounded, no more files are read
+    ahead once the sizes of those loaded but not consumed yet add up to
+    ``max_bytes``, until the consumer catches up.
+
+    .. code-block:: python
+
+       for d in load_many(filenames, workers=8, max_bytes=256 * 1024 ** 2):
+           process(text_type(d))
+
+    :param paths: An iterable of filenames.
+    :param workers: Number of threads.
+    :param max_open_fds: Maximum number of files open at the same time.
+                         Every thread keeps at most one file open, so this
+                         limits the number of threads.
+    :param max_bytes: Memory budget for contents read ahead, measured by
+                      file size. If ``None``, only the number of files read
+                      ahead is limited, to twice the number of threads.
+    :param ordered: If ``True``, results are returned in the order of
+                    ``paths``, otherwise as soon as they are loaded.
+    :param kwargs: Passed on to :class:`~data.Data`.
+    :return: A generator of materialized :class:`~data.Data` instances
+             (see :meth:`~data.Data.materialize`). Errors are raised when
+             the failed file's turn comes."""
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if max_open_fds:
+        workers = min(workers, max_open_fds)
+    max_pending = 2 * workers
+
+    def load(path):
+        return Data(file=path, **kwargs).materialize()
+
+    def size_of(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            # let the load fail and report the error
+            return 0
+
+    paths = iter(paths)
+    pending = deque() if ordered else {}
+    outstanding = 0
+    exhausted = False
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # read ahead as far as the budget allows, but always at least
+            # one file, so files larger than the budget are loaded too
+            while not exhausted and len(pending) < max_pending and (
+                    max_bytes is None or not pending or
+                    outstanding < max_bytes):
+                try:
+                    path = next(paths)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                size = size_of(path)
+                future = executor.submit(load, path)
+                if ordered:
+                    pending.append((future, size))
+                else:
+                    pending[future] = size
+                outstanding += size
+
+            if not pending:
+                return
+
+            if ordered:
+                future, size = pending.popleft()
+                done = [future]
+            else:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                outstanding -= size if ordered else pending.pop(future)
+                yield future.result()
+    finally:
+        futures = [f for f, _ in pending] if ordered else list(pending)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _map_buffer(fn, buf, encoding):
+    # runs fn on a chunk of data in memory, see Data.map_chunks
+    with Data(buf, encoding=encoding) as d:
+        return fn(d)
+
+
+def _map_file_range(fn, path, offset, length, encoding):
+    # runs fn on a memory-mapped range of a file, see Data.map_chunks
+    if not length:
+        return _map_buffer(fn, b'', encoding)
+
+    # maps must start at a multiple of the allocation granularity
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), length + offset - start, offset=start,
+                       access=mmap.ACCESS_READ)
+
+    view = memoryview(mm)[offset - start:]
+    try:
+        return _map_buffer(fn, view, encoding)
+    finally:
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            # still referenced, released along with the last reference
+            pass
@@ -0,0 +1,118 @@
+"""Asyncio support for :class:`~data.Data`.
+
+The coroutines in this module back the ``a``-prefixed methods of
+:class:`~data.Data` (e.g. :meth:`~data.Data.aread`). Data held in memory is
+processed inside the event loop right away, while anything that requires
+file I/O is offloaded to a bounded thread pool, so the event loop is never
+blocked.
+
+Note that a single :class:`~data.Data` instance has a single stream; reading
+from it concurrently is not supported.
+
+Requires Python 3.7 or later; on older versions, importing this module (or
+calling any of the ``a``-prefixed methods) raises :exc:`SyntaxError`.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+import sys
+import threading
+
+
+#: Number of threads used by the default executor.
+max_workers = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the executor used to offload blocking I/O, creating a
+    :class:`~concurrent.futures.ThreadPoolExecutor` with
+    :data:`~data.aio.max_workers` threads if none has been set."""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers)
+        return _executor
+
+
+def set_executor(executor):
+    """Set the executor used to offload blocking I/O.
+
+    :param executor: A :class:`~concurrent.futures.Executor` instance."""
+    global _executor
+
+    with _executor_lock:
+        _executor = executor
+
+
+def _in_memory(d):
+    return d.file is None and d.filename is None
+
+
+async def _run(blocking, func, *args, **kwargs):
+    if not blocking:
+        return func(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(),
+                                      partial(func, *args, **kwargs))
+
+
+async def aread(d, size=-1):
+    """Coroutine version of :meth:`~data.Data.read`."""
+    return await _run(not _in_memory(d), d.read, size)
+
+
+async def areadb(d, size=-1):
+    """Coroutine version of :meth:`~data.Data.readb`."""
+    return await _run(not _in_memory(d), d.readb, size)
+
+
+async def areadline(d, size=-1):
+    """Coroutine version of :meth:`~data.Data.readline`."""
+    return await _run(not _in_memory(d), d.readline, size)
+
+
+async def anext(d):
+    """Returns the next line, raising :exc:`StopAsyncIteration` at the end
+    of the data."""
+    line = await _run(not _in_memory(d), d._next_line, False, d.buffer_size)
+    if not line:
+        raise StopAsyncIteration
+    return line
+
+
+async def asave_to(d, file, buffer_size=None, **kwargs):
+    """Coroutine version of :meth:`~data.Data.save_to`."""
+    # only in-memory file-likes can be written to without blocking
+    blocking = not _in_memory(d) or not hasattr(file, 'write')
+    if not blocking:
+        try:
+            file.fileno()
+        except Exception:
+            pass
+        else:
+            blocking = True
+
+    return await _run(blocking, d.save_to, file, buffer_size, **kwargs)
+
+
+@asynccontextmanager
+async def atemp_saved(d, *args, **kwargs):
+    """Asynchronous context manager version of
+    :meth:`~data.Data.temp_saved`."""
+    cm = d.temp_saved(*args, **kwargs)
+    tmp = await _run(True, cm.__enter__)
+
+    try:
+        yield tmp
+    except BaseException:
+        if not await _run(True, cm.__exit__, *sys.exc_info()):
+            raise
+    else:
+        await _run(True, cm.__exit__, None, None, None)
@@ -0,0 +1,123 @@
+"""Caching of file contents shared between :class:`~data.Data` instances.
+
+Caching is opt-in, enable it by setting :attr:`~data.Data.content_cache`:
+
+.. code-block:: python
+
+    from data import Data
+    from data.cache import ContentCache
+
+    Data.content_cache = ContentCache(max_bytes=32 * 1024 * 1024)
+
+A small instance is used by default to remember file digests, see
+:attr:`~data.Data.digest_cache`.
+"""
+
+from collections import OrderedDict
+import os
+from stat import S_ISREG
+import sys
+import threading
+
+
+class ContentCache(object):
+    """A thread-safe LRU cache for file contents, bounded by the total size of
+    the cached values.
+
+    Entries are keyed by the file's path, inode, modification time and size,
+    so a file that changes on disk will not be served from the cache. Both
+    raw contents and decoded text are stored, the latter separately for each
+    encoding.
+
+    :param max_bytes: Upper limit for the memory used by cached values.
+                      Values larger than this are never cached."""
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, path, encoding=None):
+        """Returns the cache key for the current state of a file.
+
+        :param path: The file's path.
+        :param encoding: The encoding of the text to look up, ``None`` for
+                         raw contents or any other hashable value that
+                         tells values derived from the contents apart,
+                         e.g. digests.
+        :return: A key or ``None``, if the file cannot be cached because it
+                 is not a regular file."""
+        st = os.stat(path)
+        if not S_ISREG(st.st_mode):
+            return None
+
+        return (os.path.abspath(path), st.st_dev, st.st_ino,
+                getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, encoding)
+
+    def get(self, key):
+        """Looks up ``key``, returning ``None`` if it is not in the cache."""
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+
+            # reinsert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Stores ``value`` under ``key``, evicting the least recently used
+        entries if necessary."""
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            self._entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def invalidate(self, path):
+        """Removes all entries for ``path``."""
+        path = os.path.abspath(path)
+
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Removes all entries and resets the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns a dictionary of cache statistics: ``hits``, ``misses``,
+        ``evictions``, number of ``entries``, total ``size`` of cached values
+        and ``max_bytes``."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+            }
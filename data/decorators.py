@@ -1,12 +1,17 @@
-from decorator import FunctionMaker
-from six import PY2, wraps
+from functools import update_wrapper
+import inspect
+
+from six import PY2, wraps, exec_
 if PY2:
-    from funcsigs import signature, _empty
+    from funcsigs import signature, _empty, Parameter
 else:
-    from inspect import signature, _empty
+    from inspect import signature, _empty, Parameter
 
 from . import Data
 
+iscoroutinefunction = getattr(inspect, 'iscoroutinefunction',
+                              lambda f: False)
+
 
 def annotate(*args, **kwargs):
     """Set function annotations (on Python2 and 3)."""
@@ -68,26 +73,91 @@ def auto_instantiate(*classes):
         # collect our argspec
         sig = signature(f)
 
-        @wraps(f)
-        def _(*args, **kwargs):
-            bvals = sig.bind(*args, **kwargs)
+        converters = {}
+        for param in sig.parameters.values():
+            anno = param.annotation
+            if anno in classes or (len(classes) == 0 and anno != _empty):
+                converters[param.name] = anno
 
-            # replace with instance if desired
-            for varname, val in bvals.arguments.items():
-                anno = sig.parameters[varname].annotation
+        return _compile_wrapper(f, sig, converters)
 
-                if anno in classes or (len(classes) == 0 and anno != _empty):
-                    bvals.arguments[varname] = anno(val)
+    return decorator
 
-            return f(*bvals.args, **bvals.kwargs)
 
-        # create another layer by wrapping in a FunctionMaker. this is done
-        # to preserve the original signature
-        return FunctionMaker.create(
-            f, 'return _(%(signature)s)', dict(_=_, __wrapped__=f)
-        )
-
-    return decorator
+def _compile_wrapper(f, sig, converters):
+    # generates a wrapper with the exact signature of f, that calls f after
+    # passing each argument named in converters through its converter. all
+    # binding work is done here, once, instead of on every call
+    prefix = '_data_'
+    while any(name.startswith(prefix) for name in sig.parameters):
+        prefix += '_'
+
+    ns = {prefix + 'f': f, prefix + 'missing': object()}
+    params = []
+    call_args = []
+    kwonly_marker = True
+    posonly = 0
+    for param in sig.parameters.values():
+        name = param.name
+        spec = name
+        expr = name
+
+        if param.default is not _empty:
+            ns[prefix + 'd_' + name] = param.default
+            spec += '=' + prefix + 'd_' + name
+
+        if name in converters:
+            conv = prefix + 'c_' + name
+            ns[conv] = converters[name]
+            expr = '{}({})'.format(conv, name)
+
+            # only values actually passed in are converted, defaults are
+            # passed on as they are
+            if param.default is not _empty:
+                spec = '{}={}missing'.format(name, prefix)
+                expr = '({}d_{} if {} is {}missing else {})'.format(
+                    prefix, name, name, prefix, expr)
+
+        if param.kind == Parameter.VAR_POSITIONAL:
+            spec = '*' + spec
+            expr = '*' + expr
+            kwonly_marker = False
+        elif param.kind == Parameter.VAR_KEYWORD:
+            spec = '**' + spec
+            expr = '**' + expr
+        elif param.kind == Parameter.KEYWORD_ONLY:
+            if kwonly_marker:
+                params.append('*')
+                kwonly_marker = False
+            expr = '{}={}'.format(name, expr)
+
+        params.append(spec)
+        call_args.append(expr)
+
+        if param.kind == Parameter.POSITIONAL_ONLY:
+            posonly = len(params)
+
+    if posonly:
+        params.insert(posonly, '/')
+
+    # coroutine functions get a coroutine function wrapper, to keep them
+    # recognizable as such
+    if iscoroutinefunction(f):
+        template = ('async def {name}({params}):\n'
+                    '    return await {f}({args})\n')
+    else:
+        template = 'def {name}({params}):\n    return {f}({args})\n'
+
+    src = template.format(
+        name=prefix + 'wrapper',
+        params=', '.join(params),
+        f=prefix + 'f',
+        args=', '.join(call_args),
+    )
+    exec_(compile(src, '<auto_instantiate {}>'.format(f.__name__), 'exec'),
+          ns)
+
+    return update_wrapper(ns[prefix + 'wrapper'], f)
 
 
 def data(*argnames):
@@ -123,8 +193,32 @@ def data(*argnames):
 
 
 def file_arg(argname, file_arg_suffix='_file'):
-    # this function is currently undocumented, as it's likely to be deemed a
-    # bad idea and be removed later
+    """Allow passing a file instead of data for a :class:`~data.Data`
+    argument.
+
+    The decorated function accepts an additional keyword argument, named
+    ``argname`` followed by ``file_arg_suffix``, which is used as the ``file``
+    argument when constructing the :class:`~data.Data` instance. Anything
+    passed as ``argname`` itself is used as ``data``.
+
+    Example:
+
+    .. code-block:: python
+
+       @file_arg('buf')
+       def parse(buf, strict=False):
+           pass
+
+       parse('some data')
+       parse(buf_file='input.txt')
+
+    Inside ``parse``, ``buf`` will always be a :class:`~data.Data` instance.
+    Instances passed in as ``buf`` are used as they are.
+
+    :param argname: Name of the parameter that should be a data argument.
+    :param file_arg_suffix: Suffix appended to ``argname`` to name the file
+                            argument.
+    :return: A decorator adding the file argument."""
     file_arg_name = argname + file_arg_suffix
 
     def decorator(f):
@@ -134,16 +228,27 @@ def file_arg(argname, file_arg_suffix='_file'):
             raise ValueError('{} already has a parameter named {}'
                              .format(f, file_arg_name))
 
+        if argname not in sig.parameters:
+            raise ValueError('{} has no parameter named {}'
+                             .format(f, argname))
+
+        # the position of the argument, if it can be passed positionally.
+        # determined once here to avoid binding arguments on every call
+        pos = None
+        if sig.parameters[argname].kind in (Parameter.POSITIONAL_ONLY,
+                                            Parameter.POSITIONAL_OR_KEYWORD):
+            pos = list(sig.parameters).index(argname)
+
         @wraps(f)
         def _(*args, **kwargs):
             # remove file_arg_name from function list
             a_file = kwargs.pop(file_arg_name, None)
 
-            # bind remaining arguments
-            pbargs = sig.bind_partial(*args, **kwargs)
-
             # get data argument
-            a_data = pbargs.arguments.get(argname, None)
+            if pos is not None and len(args) > pos:
+                a_data = args[pos]
+            else:
+                a_data = kwargs.pop(argname, None)
 
             # if a Data object is already being passed in, use it
             # instead of creating a new instance
@@ -154,9 +259,12 @@ def file_arg(argname, file_arg_suffix='_file'):
                 d = Data(data=a_data, file=a_file)
 
             # replace with data instance
-            pbargs.parameters[argname] = d
+            if pos is not None and len(args) >= pos:
+                args = args[:pos] + (d,) + args[pos + 1:]
+            else:
+                kwargs[argname] = d
 
             # call original function with instantiated data argument
-            return f(*pbargs.args, **pbargs.kwargs)
+            return f(*args, **kwargs)
         return _
     return decorator
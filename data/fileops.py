@@ -0,0 +1,552 @@
+"""Low-level helpers for working with files.
+
+Copies use kernel-side methods (reflinks, ``copy_file_range``, ``sendfile``)
+where available and fall back to copying through userspace buffers.
+"""
+
+from bisect import bisect_right
+import errno
+import io
+import os
+from stat import S_ISREG
+import sys
+import tempfile
+import threading
+
+from six import text_type
+from six.moves import builtins
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+#: ``ioctl`` request number used to clone a file on Linux.
+FICLONE = 0x40049409
+
+# largest amount of bytes requested from the kernel in a single call
+_KERNEL_CHUNK = 1 << 30
+
+# errors signaling that a method is not supported for a pair of descriptors
+_UNSUPPORTED = frozenset(getattr(errno, name) for name in (
+    'EXDEV', 'EINVAL', 'ENOSYS', 'EOPNOTSUPP', 'ENOTSUP', 'ENOTTY', 'EBADF',
+    'ESPIPE', 'ETXTBSY', 'EPERM',
+) if hasattr(errno, name))
+
+
+def reflink(src_fd, dst_fd):
+    """Clone the contents of ``src_fd`` into ``dst_fd`` using copy-on-write.
+
+    :return: ``True`` if the file was cloned, ``False`` if the platform or
+             filesystem does not support it."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except (IOError, OSError) as e:
+        if e.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(src_fd, dst_fd, src_offset, dst_offset):
+    return os.copy_file_range(src_fd, dst_fd, _KERNEL_CHUNK, src_offset,
+                              dst_offset)
+
+
+def _sendfile(src_fd, dst_fd, src_offset, dst_offset):
+    if dst_offset is not None:
+        os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, src_offset, _KERNEL_CHUNK)
+
+
+def _kernel_methods():
+    if hasattr(os, 'copy_file_range'):
+        yield 'copy_file_range', _copy_file_range
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        yield 'sendfile', _sendfile
+
+
+def _write_all(fd, buf):
+    view = memoryview(buf)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def copy_fd(src_fd, dst_fd, src_offset=0, dst_offset=None,
+            buffer_size=64 * 1024):
+    """Copy everything from ``src_fd``, starting at ``src_offset``, to
+    ``dst_fd``.
+
+    The fastest available method is tried first, falling back to slower ones
+    if it is not supported for the given descriptors.
+
+    :param src_offset: Offset in the source to start reading at.
+    :param dst_offset: Offset in the destination to start writing at. If
+                       ``None``, writes at the current position of ``dst_fd``,
+                       which is required for pipes and sockets. When
+                       offsets are given, the descriptors' file positions
+                       are undefined afterwards.
+    :param buffer_size: Chunk size used when copying through userspace.
+    :return: A tuple of the name of the method used (``'reflink'``,
+             ``'copy_file_range'``, ``'sendfile'`` or ``'userspace'``) and
+             the number of bytes copied."""
+    st = os.fstat(src_fd)
+    copied = 0
+    method = 'userspace'
+
+    # pseudo-files (e.g. in /proc) report a size of zero and cannot be copied
+    # by the kernel reliably
+    if S_ISREG(st.st_mode) and st.st_size > 0:
+        if src_offset == 0 and dst_offset == 0 and\
+                os.fstat(dst_fd).st_size == 0 and reflink(src_fd, dst_fd):
+            return 'reflink', st.st_size
+
+        for name, func in _kernel_methods():
+            try:
+                while True:
+                    n = func(src_fd, dst_fd, src_offset + copied,
+                             None if dst_offset is None
+                             else dst_offset + copied)
+                    if not n:
+                        return name, copied
+                    copied += n
+                    method = name
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+
+    # continue wherever the kernel methods left off
+    os.lseek(src_fd, src_offset + copied, os.SEEK_SET)
+    if dst_offset is not None:
+        os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+
+    while True:
+        buf = os.read(src_fd, buffer_size)
+        if not buf:
+            return method, copied
+        _write_all(dst_fd, buf)
+        copied += len(buf)
+        method = 'userspace'
+
+
+class TemporaryFile(object):
+    """A file object with a name, similar to the objects returned by
+    :func:`~tempfile.NamedTemporaryFile`. Attribute access is passed through
+    to the wrapped file.
+
+    :param file: The wrapped file object.
+    :param name: Path under which the file can be opened.
+    :param strategy: How the file was created, see
+                     :meth:`~data.Data.temp_saved`."""
+    def __init__(self, file, name, strategy):
+        self.file = file
+        self.name = name
+        self.strategy = strategy
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['file'], name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        self.file.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.file.__exit__(exc_type, exc_value, traceback)
+
+
+class PrefixedReader(object):
+    """A read-only file-like that returns ``prefix`` before continuing to read
+    from ``stream``. Used to push back data read ahead from streams that
+    cannot seek.
+
+    :param prefix: Data to return first.
+    :param stream: The file-like to continue reading from."""
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    @property
+    def closed(self):
+        return self.stream.closed
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read() if size is None or size < 0\
+                else self.stream.read(size)
+
+        if size is None or size < 0:
+            buf = self.prefix + self.stream.read()
+            self.prefix = self.prefix[:0]
+            return buf
+
+        buf, self.prefix = self.prefix[:size], self.prefix[size:]
+        return buf
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+
+        if not self.prefix:
+            return self.stream.readline() if size < 0\
+                else self.stream.readline(size)
+
+        nl = u'\n' if isinstance(self.prefix, text_type) else b'\n'
+        end = self.prefix.find(nl) + 1 or len(self.prefix)
+        if size >= 0:
+            end = min(end, size)
+
+        buf = self.read(end)
+        if buf.endswith(nl) or len(buf) == size or self.prefix:
+            return buf
+
+        # the line continues in the stream
+        return buf + self.readline(size - len(buf) if size >= 0 else -1)
+
+    def close(self):
+        self.stream.close()
+
+
+# file objects reading and writing their file descriptor as it is. python 2's
+# built-in file type is one of them
+_OS_FILES = (io.FileIO,) + ((builtins.file,) if hasattr(builtins, 'file')
+                            else ())
+_BUFFERED = (io.BufferedReader, io.BufferedWriter, io.BufferedRandom)
+
+
+def os_fd(f):
+    """Returns the file descriptor of a file object that is a plain OS file,
+    or ``None``.
+
+    Only raw files and buffered files on top of them count, as their
+    contents are exactly what is read from or written to the descriptor.
+    Other file objects, like :class:`gzip.GzipFile`, may pass on the
+    ``fileno()`` of the file underneath while transforming its contents.
+
+    :param f: A file object. Temporary files from :mod:`tempfile` are
+              unwrapped."""
+    # f stays referenced, dropping the wrapper would close the file
+    raw = f
+    wrapper = getattr(tempfile, '_TemporaryFileWrapper', None)
+    if wrapper is not None and isinstance(raw, wrapper):
+        raw = raw.file
+    if isinstance(raw, _BUFFERED):
+        raw = raw.raw
+    if not isinstance(raw, _OS_FILES):
+        return None
+
+    try:
+        return raw.fileno()
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def pread(fd, offset, length=None, buffer_size=64 * 1024):
+    """Read from ``fd`` at ``offset`` without changing its file position.
+
+    :param offset: Offset to start reading at.
+    :param length: Number of bytes to read. If ``None``, read until the end
+                   of the file. Fewer bytes are returned if the end of the
+                   file is reached first.
+    :param buffer_size: Chunk size used when reading until the end of
+                        anything but a regular file.
+    :return: The bytes read."""
+    chunks = []
+
+    if length is None:
+        # the rest of a regular file is read in one go
+        st = os.fstat(fd)
+        if S_ISREG(st.st_mode) and st.st_size:
+            length = max(st.st_size - offset, 0)
+
+    if not hasattr(os, 'pread'):
+        pos = os.lseek(fd, 0, os.SEEK_CUR)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while length is None or length > 0:
+                buf = os.read(fd, buffer_size if length is None else length)
+                if not buf:
+                    break
+                chunks.append(buf)
+                if length is not None:
+                    length -= len(buf)
+        finally:
+            os.lseek(fd, pos, os.SEEK_SET)
+        return b''.join(chunks)
+
+    while length is None or length > 0:
+        buf = os.pread(fd, buffer_size if length is None else length, offset)
+        if not buf:
+            break
+        chunks.append(buf)
+        offset += len(buf)
+        if length is not None:
+            length -= len(buf)
+    return b''.join(chunks)
+
+
+def byte_view(buf):
+    """Returns a flat :class:`memoryview` of bytes on an object supporting
+    the buffer protocol, e.g. a :class:`bytearray` or an :mod:`array`."""
+    view = memoryview(buf)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+
+class BufferReader(object):
+    """A read-only binary file-like on an object supporting the buffer
+    protocol. Unlike :class:`~io.BytesIO`, the object is not copied.
+
+    :param buf: The buffer to read from."""
+    closed = False
+
+    def __init__(self, buf):
+        self.view = byte_view(buf)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += len(self.view)
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else self.pos + size
+        rv = self.view[self.pos:end].tobytes()
+        self.pos += len(rv)
+        return rv
+
+    def readinto(self, b):
+        dest = byte_view(b)
+        n = max(min(len(dest), len(self.view) - self.pos), 0)
+        dest[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def readline(self, size=-1):
+        end = len(self.view)
+        if size is not None and size >= 0:
+            end = min(self.pos + size, end)
+
+        # search for the newline in chunks, to avoid copying the rest
+        pos = self.pos
+        while pos < end:
+            chunk = self.view[pos:min(pos + 4096, end)].tobytes()
+            i = chunk.find(b'\n')
+            if i >= 0:
+                end = pos + i + 1
+                break
+            pos += len(chunk)
+
+        return self.read(max(end - self.pos, 0))
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TeeBuffer(object):
+    """Shares data read once from a source between several readers, see
+    :meth:`~data.Data.tee`.
+
+    Data is kept until every reader has read it. If readers drift apart by
+    more than ``max_memory`` bytes, further data is written to an anonymous
+    temporary file instead of being kept in memory.
+
+    :param read: Called with ``buffer_size`` to read the next chunk of bytes
+                 from the source, returning an empty bytestring at the end.
+    :param n: Number of readers.
+    :param max_memory: Maximum number of bytes kept in memory.
+    :param buffer_size: Size of the chunks read from the source.
+    :param dir: Directory for the temporary file.
+    :param on_close: Called once all readers have been closed."""
+    def __init__(self, read, n, max_memory=1024 * 1024,
+                 buffer_size=64 * 1024, dir=None, on_close=None):
+        self.max_memory = max_memory
+        self.buffer_size = buffer_size
+        self.dir = dir
+        self.on_close = on_close
+        self.readers = [TeeReader(self) for _ in range(n)]
+
+        self._read = read
+        self._eof = False
+        self._lock = threading.Lock()
+
+        # retained data as consecutive segments, each starting at the
+        # corresponding offset in the source and held either as bytes or as
+        # an (offset, length) tuple in the spill file
+        self._offsets = []
+        self._segments = []
+        self._end = 0
+        self._memory = 0
+        self._spill = None
+        self._spill_end = 0
+
+    @property
+    def memory(self):
+        """Number of bytes currently kept in memory."""
+        return self._memory
+
+    def _fill(self):
+        # reads the next chunk from the source, returns False at the end
+        if self._eof:
+            return False
+
+        chunk = self._read(self.buffer_size)
+        if not chunk:
+            self._eof = True
+            return False
+
+        if self._memory + len(chunk) > self.max_memory:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(dir=self.dir)
+            self._spill.seek(self._spill_end)
+            self._spill.write(chunk)
+            segment = (self._spill_end, len(chunk))
+            self._spill_end += len(chunk)
+        else:
+            segment = chunk
+            self._memory += len(chunk)
+
+        self._offsets.append(self._end)
+        self._segments.append(segment)
+        self._end += len(chunk)
+        return True
+
+    def _get(self, pos, size):
+        # returns up to size bytes starting at pos from a single segment
+        i = bisect_right(self._offsets, pos) - 1
+        segment = self._segments[i]
+        start = pos - self._offsets[i]
+
+        if isinstance(segment, tuple):
+            offset, length = segment
+            self._spill.seek(offset + start)
+            return self._spill.read(min(length - start, size))
+        return segment[start:start + size]
+
+    def read(self, reader, size, line=False):
+        """Reads up to ``size`` bytes (or the rest, if negative) for
+        ``reader``, stopping after the first newline if ``line`` is set."""
+        if size is None or size < 0:
+            size = sys.maxsize
+
+        with self._lock:
+            chunks = []
+            pos = reader.pos
+            while size > 0:
+                if pos >= self._end and not self._fill():
+                    break
+
+                chunk = self._get(pos, size)
+                end = chunk.find(b'\n') + 1 if line else 0
+                if end:
+                    chunk = chunk[:end]
+
+                chunks.append(chunk)
+                pos += len(chunk)
+                size -= len(chunk)
+                if end:
+                    break
+
+            reader.pos = pos
+            self._trim()
+            return b''.join(chunks)
+
+    def _trim(self):
+        # drops segments that every open reader is past
+        positions = [r.pos for r in self.readers if not r.closed]
+        low = min(positions) if positions else self._end
+
+        n = 0
+        while n < len(self._segments) and\
+                self._offsets[n] + self._length(n) <= low:
+            if not isinstance(self._segments[n], tuple):
+                self._memory -= len(self._segments[n])
+            n += 1
+        del self._offsets[:n]
+        del self._segments[:n]
+
+        # reuse the spill file once nothing in it is needed anymore
+        if self._spill_end and not any(
+                isinstance(s, tuple) for s in self._segments):
+            self._spill_end = 0
+            self._spill.truncate(0)
+
+    def _length(self, i):
+        segment = self._segments[i]
+        return segment[1] if isinstance(segment, tuple) else len(segment)
+
+    def close_reader(self, reader):
+        with self._lock:
+            if reader.closed:
+                return
+            reader.closed = True
+            self._trim()
+
+            if not all(r.closed for r in self.readers):
+                return
+
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+        if self.on_close is not None:
+            self.on_close()
+
+
+class TeeReader(object):
+    """A read-only binary file-like returned by :class:`TeeBuffer`."""
+    closed = False
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        return self.buffer.read(self, size)
+
+    def readline(self, size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        return self.buffer.read(self, size, line=True)
+
+    def close(self):
+        self.buffer.close_reader(self)
@@ -0,0 +1,176 @@
+"""Indexes of line offsets, for random access to the lines of large data.
+
+See :meth:`~data.Data.line`, :meth:`~data.Data.lines` and
+:meth:`~data.Data.line_index`. Indexes of files can be saved next to the file
+(with :data:`~data.lineindex.SUFFIX` appended to its name) and are rebuilt if
+the file's size or modification time changes.
+"""
+
+from array import array
+from itertools import repeat
+from operator import add
+import os
+import struct
+import sys
+
+try:
+    from itertools import accumulate
+except ImportError:
+    def accumulate(iterable):
+        total = 0
+        for value in iterable:
+            total += value
+            yield total
+
+
+#: Appended to a file's name to get the name of its saved index.
+SUFFIX = '.lineidx'
+
+#: Size of the blocks read while scanning for newlines.
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def _typecode():
+    # 'Q' is missing on Python 2, where 'L' has 64 bits on most platforms
+    for code in ('Q', 'L'):
+        try:
+            if array(code).itemsize == 8:
+                return code
+        except ValueError:
+            pass
+    return 'L'
+
+
+#: Type of the :class:`array.array` holding the offsets, an unsigned 64 bit
+#: integer where available.
+TYPECODE = _typecode()
+
+_MAGIC = b'DLIX'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBQQQQ')
+
+
+class LineIndex(object):
+    """Start offsets of all lines in a buffer or file. Lines end with
+    ``\\n``, the last line may lack it. Indexes of text count characters
+    instead of bytes.
+
+    :param starts: An :class:`array.array` of type
+                   :data:`~data.lineindex.TYPECODE` with the offset of every
+                   line.
+    :param size: Total size of the data.
+    :param stamp: A tuple of size and modification time (in nanoseconds) of
+                  the indexed file, if any. An index is only valid while the
+                  file's stamp matches."""
+    def __init__(self, starts, size, stamp=None):
+        self.starts = starts
+        self.size = size
+        self.stamp = stamp
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, start, stop=None):
+        """Returns offset and length of the bytes of lines ``start`` up to,
+        but not including, ``stop``. Both are clamped to the available
+        lines, like slice indices.
+
+        :param stop: If ``None``, up to the last line."""
+        start, stop, _ = slice(start, stop).indices(len(self.starts))
+        if start >= stop:
+            return 0, 0
+
+        offset = self.starts[start]
+        end = self.starts[stop] if stop < len(self.starts) else self.size
+        return offset, end - offset
+
+    @classmethod
+    def build(cls, blocks, stamp=None):
+        """Builds an index by scanning consecutive blocks of bytes.
+
+        The newlines in each block are located by splitting it, so the
+        offsets are computed in bulk instead of line by line.
+
+        :param blocks: An iterable of bytestrings or of unicode strings.
+        :param stamp: See :class:`~data.lineindex.LineIndex`."""
+        starts = array(TYPECODE, [0])
+        pos = 0
+        for block in blocks:
+            # the part after the last newline does not end a line
+            parts = block.split(b'\n' if isinstance(block, bytes) else u'\n')
+            parts.pop()
+
+            # every line starts after the previous one's newline
+            ends = accumulate(map(add, map(len, parts), repeat(1)))
+            starts.extend(map(add, ends, repeat(pos)))
+            pos += len(block)
+
+        # a newline at the very end does not start another line
+        if starts[-1] == pos:
+            starts.pop()
+        return cls(starts, pos, stamp)
+
+    @classmethod
+    def load(cls, path, stamp):
+        """Loads an index saved using :meth:`~data.lineindex.LineIndex.save`.
+
+        :param path: Path of the index.
+        :param stamp: The indexed file's current stamp, see
+                      :class:`~data.lineindex.LineIndex`.
+        :return: The index or ``None``, if there is no valid index for the
+                 file in its current state."""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                if len(header) != _HEADER.size:
+                    return None
+
+                magic, version, size, fsize, mtime, count =\
+                    _HEADER.unpack(header)
+                if magic != _MAGIC or version != _VERSION or\
+                        (fsize, mtime) != tuple(stamp):
+                    return None
+
+                # offsets are saved as little-endian 64 bit integers
+                starts = array(TYPECODE)
+                if starts.itemsize == 8:
+                    starts.fromfile(f, count)
+                    if sys.byteorder != 'little':
+                        starts.byteswap()
+                else:
+                    buf = f.read(count * 8)
+                    starts.extend(struct.unpack(
+                        '<{}Q'.format(len(buf) // 8), buf))
+                    if len(starts) != count:
+                        return None
+        except (IOError, OSError, EOFError, ValueError, OverflowError):
+            return None
+
+        return cls(starts, size, stamp)
+
+    def save(self, path):
+        """Saves the index of a file to ``path``, replacing it atomically.
+        Requires a ``stamp``."""
+        starts = self.starts
+        if starts.itemsize == 8 and sys.byteorder != 'little':
+            starts = array(TYPECODE, starts)
+            starts.byteswap()
+
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, self.size,
+                                     *(self.stamp + (len(starts),))))
+
+                # offsets are saved as little-endian 64 bit integers
+                if starts.itemsize == 8:
+                    starts.tofile(f)
+                else:
+                    f.write(struct.pack('<{}Q'.format(len(starts)), *starts))
+            os.rename(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,88 @@
+"""Optional instrumentation of :class:`~data.Data` instances.
+
+Hooks registered using :func:`~data.metrics.add_hook` are called for events
+like reading data, converting between bytes and text or saving data. With no
+hooks registered, the only cost is a single check per operation.
+
+Every hook is called as ``hook(event, value, tags)``, where ``tags`` is a
+dictionary that always contains ``backing`` (one of ``'bytes'``, ``'text'``,
+``'file'`` or ``'filename'``). The following events are emitted:
+
+``bytes_read``
+    Number of bytes read from a file or buffer.
+``bytes_written``
+    Number of bytes written by :meth:`~data.Data.save_to`.
+``materialize``
+    The complete data was converted to bytes or text (``value`` is ``1``,
+    ``tags['type']`` is ``'bytes'`` or ``'text'``).
+``decode_seconds``, ``encode_seconds``
+    Time spent converting between bytes and text.
+``spool``
+    A file-like was spooled by :meth:`~data.Data.spool` (``value`` is ``1``,
+    ``tags['spilled']`` tells whether it was written to a temporary file).
+``save_to``
+    A call to :meth:`~data.Data.save_to` (``value`` is ``1``,
+    ``tags['method']`` names the method used for copying, e.g.
+    ``'copy_file_range'``, ``'stream'``, ``'write'`` or ``'transcode'``).
+"""
+
+from collections import defaultdict
+import threading
+
+
+#: Registered hooks. Use :func:`~data.metrics.add_hook` and
+#: :func:`~data.metrics.remove_hook` to change.
+hooks = []
+
+
+def add_hook(hook):
+    """Register a hook to be called for every event.
+
+    :param hook: A callable accepting ``event``, ``value`` and ``tags``.
+    :return: ``hook``, allowing use as a decorator."""
+    hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    """Unregister a previously registered hook."""
+    hooks.remove(hook)
+
+
+def emit(event, value, tags):
+    """Pass an event on to all registered hooks."""
+    for hook in list(hooks):
+        hook(event, value, tags)
+
+
+class Counter(object):
+    """A hook that sums up the values of all events, grouped by event and
+    tags. Register it using :func:`~data.metrics.add_hook` and periodically
+    export a :meth:`~data.metrics.Counter.snapshot`."""
+    def __init__(self):
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, event, value, tags):
+        key = (event, tuple(sorted(tags.items())))
+        with self._lock:
+            self._values[key] += value
+
+    def snapshot(self, reset=False):
+        """Returns the current totals as a dictionary, mapping tuples of
+        event name and sorted tag items to the summed values.
+
+        :param reset: If ``True``, start over from zero afterwards."""
+        with self._lock:
+            rv = dict(self._values)
+            if reset:
+                self._values.clear()
+        return rv
+
+    def total(self, event, **tags):
+        """Returns the sum of all values for ``event`` with matching
+        ``tags``."""
+        with self._lock:
+            return sum(value for (name, items), value in self._values.items()
+                       if name == event and
+                       all(item in items for item in tags.items()))
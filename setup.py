@@ -21,7 +21,7 @@ setup(
     url='http://github.com/mbr/data',
     license='MIT',
     packages=find_packages(exclude=['tests']),
-    install_requires=['six', 'decorator', 'funcsigs'],
+    install_requires=['six', 'funcsigs'],
     classifiers=[
         'Programming Language :: Python :: 2',
         'Programming Language :: Python :: 3',
@@ -0,0 +1,7 @@
+import sys
+
+collect_ignore = []
+
+# data.aio and its tests use syntax added in Python 3.7
+if sys.version_info < (3, 7):
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,60 @@
+import asyncio
+import inspect
+import os
+
+import pytest
+
+from data import Data
+from data.decorators import data
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(params=['text', 'filename'])
+def d(request, tmpdir):
+    if request.param == 'text':
+        return Data(u'line one\nline two\n')
+
+    fn = tmpdir.join('input.txt')
+    fn.write_binary(b'line one\nline two\n')
+    return Data(file=str(fn))
+
+
+def test_aread(d):
+    assert run(d.aread(4)) == u'line'
+    assert run(d.areadb()) == b' one\nline two\n'
+
+
+def test_async_iteration(d):
+    async def collect():
+        return [line async for line in d]
+
+    assert run(collect()) == [u'line one\n', u'line two\n']
+
+
+def test_asave_to(d, tmpdir):
+    fn = str(tmpdir.join('out.txt'))
+    run(d.asave_to(fn))
+
+    with open(fn, 'rb') as f:
+        assert f.read() == b'line one\nline two\n'
+
+
+def test_atemp_saved(d):
+    async def use():
+        async with d.atemp_saved() as tmp:
+            assert tmp.read() == b'line one\nline two\n'
+            return tmp.name
+
+    assert not os.path.exists(run(use()))
+
+
+def test_data_decorator_preserves_coroutine():
+    @data('buf')
+    async def handler(buf):
+        return await buf.aread()
+
+    assert inspect.iscoroutinefunction(handler)
+    assert run(handler(b'hello')) == u'hello'
@@ -0,0 +1,77 @@
+import os
+
+from six import text_type, binary_type
+import pytest
+
+from data import Data
+from data.cache import ContentCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ContentCache(max_bytes=4096)
+    monkeypatch.setattr(Data, 'content_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def fn(tmpdir):
+    fn = tmpdir.join('cached.txt')
+    fn.write_binary(u'\xe4 cached'.encode('utf8'))
+    return str(fn)
+
+
+def test_cached_bytes(cache, fn):
+    assert binary_type(Data(file=fn)) == u'\xe4 cached'.encode('utf8')
+    assert binary_type(Data(file=fn)) == u'\xe4 cached'.encode('utf8')
+
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cached_text_per_encoding(cache, fn):
+    assert text_type(Data(file=fn)) == u'\xe4 cached'
+    assert text_type(Data(file=fn, encoding='latin1')) ==\
+        u'\xe4 cached'.encode('utf8').decode('latin1')
+    assert text_type(Data(file=fn)) == u'\xe4 cached'
+
+    assert cache.hits >= 1
+
+
+def test_changed_file_not_served_from_cache(cache, fn):
+    binary_type(Data(file=fn))
+
+    with open(fn, 'wb') as f:
+        f.write(b'changed contents')
+    st = os.stat(fn)
+    os.utime(fn, (st.st_atime, st.st_mtime + 10))
+
+    assert binary_type(Data(file=fn)) == b'changed contents'
+
+
+def test_invalidate(cache, fn):
+    binary_type(Data(file=fn))
+    assert len(cache) == 1
+
+    cache.invalidate(fn)
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_eviction(cache, tmpdir):
+    for i in range(10):
+        fn = tmpdir.join('{}.bin'.format(i))
+        fn.write_binary(b'x' * 1000)
+        binary_type(Data(file=str(fn)))
+
+    assert cache.size <= cache.max_bytes
+    assert cache.evictions > 0
+    assert len(cache) + cache.evictions == 10
+
+
+def test_too_large_not_cached(cache, tmpdir):
+    fn = tmpdir.join('large.bin')
+    fn.write_binary(b'x' * 8192)
+    binary_type(Data(file=str(fn)))
+
+    assert len(cache) == 0
@@ -1,10 +1,17 @@
 import types
 
+from six import PY2, text_type
+
 from data import Data
-from data.decorators import auto_instantiate, annotate, data
+from data.decorators import auto_instantiate, annotate, data, file_arg
 
 import pytest
 
+if PY2:
+    from funcsigs import signature
+else:
+    from inspect import signature
+
 
 # based on https://stackoverflow.com/questions/6527633
 #          /how-can-i-make-a-deepcopy-of-a-function-in-python
@@ -65,3 +72,84 @@ def test_data_decorator(decfunc_data):
 
     assert isinstance(b, Data)
     assert not isinstance(a, Data)
+
+
+def test_auto_instantiate_preserves_signature(decfunc_all):
+    f = copy_func(sample_func, 'foo')
+    f.__defaults__ = (5,)
+
+    g = auto_instantiate()(annotate(a=int, b=str)(f))
+
+    assert g.__name__ == 'foo'
+    assert signature(g) == signature(f)
+    assert g(1.5) == (1, 5, (), {})
+    assert g(1.5, 5) == (1, '5', (), {})
+    assert g(1.5, 2, 3, x=4) == (1, '2', (3,), {'x': 4})
+    assert g(b=2, a=1.5) == (1, '2', (), {})
+
+
+def test_auto_instantiate_parameter_named_like_internals():
+    def f(_data_f, _data_c_x):
+        return _data_f, _data_c_x
+
+    g = auto_instantiate()(annotate(_data_f=int, _data_c_x=str)(f))
+
+    assert g(1.5, 2) == (1, '2')
+
+
+def test_data_decorator_keyword(decfunc_data):
+    a, b, c, d = decfunc_data(a='hello', b='world')
+
+    assert isinstance(b, Data)
+    assert not isinstance(a, Data)
+
+
+@pytest.fixture
+def decfunc_file():
+    f = copy_func(sample_func, 'decfunc_file')
+    return file_arg('b')(f)
+
+
+def test_file_arg_positional(decfunc_file):
+    a, b, c, d = decfunc_file('hello', 'world', 1, x=2)
+
+    assert isinstance(b, Data)
+    assert text_type(b) == u'world'
+    assert (a, c, d) == ('hello', (1,), {'x': 2})
+
+
+def test_file_arg_keyword(decfunc_file):
+    a, b, c, d = decfunc_file(a='hello', b='world')
+
+    assert isinstance(b, Data)
+    assert text_type(b) == u'world'
+    assert d == {}
+
+
+def test_file_arg_file(decfunc_file, tmpdir):
+    fn = tmpdir.join('input.txt')
+    fn.write('from a file')
+
+    a, b, c, d = decfunc_file('hello', b_file=str(fn))
+
+    assert text_type(b) == u'from a file'
+    assert d == {}
+
+
+def test_file_arg_data_passthrough(decfunc_file):
+    arg = Data(u'world')
+
+    assert decfunc_file('hello', arg)[1] is arg
+
+
+def test_file_arg_data_and_file(decfunc_file):
+    with pytest.raises(ValueError):
+        decfunc_file('hello', 'world', b_file='input.txt')
+
+
+def test_file_arg_name_clash():
+    def f(a, a_file):
+        pass
+
+    with pytest.raises(ValueError):
+        file_arg('a')(f)
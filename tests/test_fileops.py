@@ -0,0 +1,187 @@
+from io import BytesIO
+import os
+import tempfile
+
+import pytest
+
+from data import fileops
+
+
+@pytest.fixture(params=[0, 1, 200000])
+def srcfile(request):
+    with tempfile.TemporaryFile() as f:
+        f.write(os.urandom(request.param))
+        f.flush()
+        yield f
+
+
+@pytest.fixture(params=['kernel', 'userspace'])
+def methods(request, monkeypatch):
+    if request.param == 'userspace':
+        monkeypatch.setattr(fileops, '_kernel_methods', lambda: iter(()))
+        monkeypatch.setattr(fileops, 'reflink', lambda src, dst: False)
+
+
+def test_copy_fd(srcfile, methods):
+    expected = srcfile.seek(0) or srcfile.read()
+
+    with tempfile.TemporaryFile() as dst:
+        method, copied = fileops.copy_fd(srcfile.fileno(), dst.fileno(), 0, 0,
+                                         4096)
+
+        assert copied == len(expected)
+        dst.seek(0)
+        assert dst.read() == expected
+
+
+def test_copy_fd_to_pipe(srcfile, methods):
+    expected = srcfile.seek(0) or srcfile.read()
+    expected = expected[:32768]
+    srcfile.truncate(len(expected))
+
+    r, w = os.pipe()
+    try:
+        method, copied = fileops.copy_fd(srcfile.fileno(), w, 0, None)
+        os.close(w)
+        w = None
+
+        buf = b''
+        while True:
+            chunk = os.read(r, 65536)
+            if not chunk:
+                break
+            buf += chunk
+        assert buf == expected
+    finally:
+        os.close(r)
+        if w is not None:
+            os.close(w)
+
+
+def test_os_fd(tmpdir):
+    import gzip
+    fn = str(tmpdir.join('file'))
+
+    with open(fn, 'wb') as f:
+        assert fileops.os_fd(f) == f.fileno()
+    with tempfile.NamedTemporaryFile() as f:
+        assert fileops.os_fd(f) == f.fileno()
+    with gzip.open(fn, 'wb') as f:
+        assert fileops.os_fd(f) is None
+    with open(fn) as f:
+        assert fileops.os_fd(f) is None
+    assert fileops.os_fd(BytesIO()) is None
+
+
+def test_buffer_reader():
+    r = fileops.BufferReader(bytearray(b'one\ntwo\nthree'))
+
+    assert r.readline() == b'one\n'
+    assert r.read(2) == b'tw'
+    assert r.readline(1) == b'o'
+    assert r.readline() == b'\n'
+
+    buf = bytearray(10)
+    assert r.readinto(buf) == 5
+    assert buf[:5] == b'three'
+    assert r.read() == b''
+
+    r.seek(-5, os.SEEK_END)
+    assert r.read() == b'three'
+
+
+
+def _tee(payload, n=2, max_memory=1024 * 1024, chunk=4):
+    src = BytesIO(payload)
+    closed = []
+    buf = fileops.TeeBuffer(src.read, n, max_memory, chunk,
+                            on_close=lambda: closed.append(True))
+    return buf, closed
+
+
+def test_tee_buffer():
+    buf, closed = _tee(b'0123456789abcdef')
+    a, b = buf.readers
+
+    assert a.read(6) == b'012345'
+    assert b.read(3) == b'012'
+    assert a.read() == b'6789abcdef'
+    assert b.read(5) == b'34567'
+    assert buf.memory <= 10
+
+    assert b.read() == b'89abcdef'
+    assert buf.memory == 0
+    assert a.read() == b''
+
+    a.close()
+    assert not closed
+    b.close()
+    assert closed
+
+
+def test_tee_buffer_spills():
+    payload = os.urandom(10000)
+    buf, _ = _tee(payload, max_memory=100, chunk=64)
+    a, b = buf.readers
+
+    assert a.read() == payload
+    assert buf.memory <= 100
+    assert buf._spill is not None
+
+    result = b''
+    while True:
+        chunk = b.read(7)
+        if not chunk:
+            break
+        result += chunk
+    assert result == payload
+
+
+def test_tee_buffer_closed_reader_releases_data():
+    buf, _ = _tee(b'x' * 100)
+    a, b = buf.readers
+
+    a.read()
+    assert buf.memory == 100
+    b.close()
+    assert buf.memory == 0
+
+    with pytest.raises(ValueError):
+        b.read()
+
+
+def test_tee_buffer_threads():
+    import threading
+    payload = os.urandom(200000)
+    buf, _ = _tee(payload, n=4, max_memory=1000, chunk=1000)
+    results = [None] * 4
+
+    def consume(i):
+        chunks = []
+        while True:
+            chunk = buf.readers[i].read(100 * (i + 1))
+            if not chunk:
+                break
+            chunks.append(chunk)
+        results[i] = b''.join(chunks)
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [payload] * 4
+
+
+def test_tee_buffer_readline():
+    buf, _ = _tee(b'one\ntwo\nthree', chunk=3)
+    a, b = buf.readers
+
+    assert a.readline() == b'one\n'
+    assert a.readline(2) == b'tw'
+    assert a.readline() == b'o\n'
+    assert b.read(5) == b'one\nt'
+    assert a.readline() == b'three'
+    assert a.readline() == b''
+    assert b.readline() == b'wo\n'
@@ -2,10 +2,11 @@
 
 from contextlib import contextmanager
 from functools import partial
+import gc
 import os
 import tempfile
 
-from six import text_type, binary_type, PY2, reraise, StringIO
+from six import text_type, binary_type, PY2, reraise, StringIO, BytesIO
 import pytest
 
 from data import Data as I
@@ -61,6 +62,7 @@ def valfile(val, tmpfile, encoding):
 @pytest.fixture(
     params=['file', 'filename', 'unicode', 'string', 'smart_file',
             'smart_unicode', 'smart_string', 'move_constructor', 'mvc_file',
+            'bytearray', 'memoryview',
             pytest.mark.skipif("PY2")('file_no_encoding')]
 )
 def d(val, request, encoding, valfile):
@@ -78,6 +80,10 @@ def d(val, request, encoding, valfile):
         v = I(val, encoding=encoding)
     elif request.param == 'smart_string':
         v = I(val.encode(encoding), encoding=encoding)
+    elif request.param == 'bytearray':
+        v = I(bytearray(val.encode(encoding)), encoding=encoding)
+    elif request.param == 'memoryview':
+        v = I(memoryview(val.encode(encoding)), encoding=encoding)
     elif request.param == 'file_no_encoding':
         v = I(open(valfile, 'r', encoding=encoding))
     elif request.param == 'move_constructor':
@@ -89,8 +95,6 @@ def d(val, request, encoding, valfile):
     else:
         raise RuntimeError
 
-    v._test_req = request.param
-
     return v
 
 
@@ -184,3 +188,1061 @@ def test_iteration(d, val):
     chunks = [l for l in iter(d)]
 
     assert ''.join(chunks) == val
+
+
+def test_no_instance_dict():
+    d = I(b'a\nb')
+
+    assert not hasattr(d, '__dict__')
+    assert next(d) == u'a\n'
+
+
+def test_iter_text_chunks(d, val):
+    assert u''.join(d.iter_text_chunks(3)) == val
+
+
+def test_iter_byte_chunks(d, val, encoding):
+    assert b''.join(d.iter_byte_chunks(3)) == val.encode(encoding)
+
+
+def test_read_split_multibyte_sequence():
+    d = I(u'\xe4\xfc\xf6'.encode('utf8'), encoding='utf8')
+
+    assert d.read(1) == u'\xe4'
+    assert d.read(3) == u'\xfc'
+    assert d.readb() == u'\xf6'.encode('utf8')
+
+
+def test_read_truncated_multibyte_sequence():
+    d = I(u'a\xe4'.encode('utf8')[:-1], encoding='utf8')
+
+    with pytest.raises(UnicodeDecodeError):
+        list(d.iter_text_chunks(1))
+
+
+def test_view(d, val, encoding):
+    with d:
+        assert d.view().tobytes() == val.encode(encoding)
+
+
+def test_view_is_memory_mapped(valfile, val, encoding):
+    d = I(file=valfile, encoding=encoding)
+    v = d.view()
+
+    assert v.tobytes() == val.encode(encoding)
+    if val:
+        assert d._mmap is not None
+
+    v.release()
+    d.close()
+    assert d._mmap is None
+
+
+def test_unicode_from_memory_map(valfile, val, encoding, monkeypatch):
+    monkeypatch.setattr(I, 'mmap_threshold', 1)
+    d = I(file=valfile, encoding=encoding)
+
+    assert text_type(d) == val
+
+
+def test_write_to_file_obj_at_offset(d, val, encoding):
+    with tempfile.NamedTemporaryFile() as tmp:
+        tmp.write(b'head')
+        d.save_to(tmp, buffer_size=3)
+        tmp.write(b'tail')
+
+        tmp.seek(0)
+
+        assert tmp.read() == b'head' + val.encode(encoding) + b'tail'
+
+
+def test_write_from_partially_read_file(valfile, val, encoding):
+    with open(valfile, 'rb') as src, tempfile.TemporaryFile() as tmp:
+        src.read(1)
+        I(file=src, encoding=encoding).save_to(tmp)
+
+        assert src.read() == b''
+        tmp.seek(0)
+        assert tmp.read() == val.encode(encoding)[1:]
+
+
+@pytest.mark.parametrize('module', ['gzip', 'bz2', 'lzma'])
+@pytest.mark.parametrize('backing', ['file', 'filename'])
+def test_save_to_compressed_file(tmpdir, module, backing):
+    mod = pytest.importorskip(module)
+    payload = b'compressed payload\n' * 100
+    src, out = str(tmpdir.join('src')), str(tmpdir.join('out'))
+    with open(src, 'wb') as f:
+        f.write(payload)
+
+    # written through the compressor, not to the file underneath
+    d = I(open(src, 'rb')) if backing == 'file' else I(file=src)
+    with d, mod.open(out, 'wb') as f:
+        d.save_to(f)
+
+    # read through the decompressor
+    with mod.open(out, 'rb') as f, tempfile.TemporaryFile() as tmp:
+        I(f).save_to(tmp)
+
+        tmp.seek(0)
+        assert tmp.read() == payload
+
+
+@pytest.mark.parametrize('target', ['utf-16', 'latin1', 'utf8'])
+def test_save_to_transcodes(d, val, target):
+    with tempfile.TemporaryFile() as tmp:
+        d.save_to(tmp, buffer_size=3, encoding=target)
+
+        tmp.seek(0)
+        assert tmp.read() == val.encode(target)
+
+
+def test_save_to_translates_newlines(d, val, encoding, tmpdir):
+    fn = str(tmpdir.join('out'))
+    d.save_to(fn, buffer_size=3, newline=u'\r\n')
+
+    with open(fn, 'rb') as f:
+        assert f.read() == val.replace(u'\n', u'\r\n').encode(encoding)
+
+
+def test_save_to_transcode_errors(valfile, val, encoding):
+    d = I(file=valfile, encoding=encoding)
+    with tempfile.TemporaryFile() as tmp:
+        d.save_to(tmp, encoding='ascii', errors='replace')
+
+        tmp.seek(0)
+        assert tmp.read() == val.encode('ascii', 'replace')
+
+    with tempfile.TemporaryFile() as tmp:
+        with pytest.raises(UnicodeEncodeError):
+            I(u'\xe4').save_to(tmp, encoding='ascii')
+
+
+def test_save_to_streams_text(monkeypatch):
+    val = u'\xe4' * 100
+    d = I(val)
+    monkeypatch.setattr(I, '__bytes__', None)
+
+    with tempfile.TemporaryFile() as tmp:
+        d.save_to(tmp, buffer_size=7)
+
+        tmp.seek(0)
+        assert tmp.read() == val.encode('utf8')
+
+
+@pytest.mark.parametrize('strategy', ['copy', 'auto'])
+def test_with_temp_saved_strategy(d, val, encoding, strategy):
+    with d.temp_saved(strategy=strategy) as tmp:
+        assert tmp.strategy in ('copy', 'reflink', 'memfd')
+        tmp.close()
+        assert open(tmp.name, 'rb').read() == val.encode(encoding)
+    assert not os.path.exists(tmp.name)
+
+
+def test_with_temp_saved_link(valfile, val, encoding):
+    d = I(file=valfile, encoding=encoding)
+
+    with d.temp_saved(strategy='link', dir=os.path.dirname(valfile)) as tmp:
+        assert tmp.strategy == 'link'
+        assert tmp.name != valfile
+        assert os.path.samefile(tmp.name, valfile)
+        assert tmp.read() == val.encode(encoding)
+    assert not os.path.exists(tmp.name)
+    assert os.path.exists(valfile)
+
+
+@pytest.mark.skipif('not hasattr(os, "memfd_create")')
+def test_with_temp_saved_memfd(val, encoding):
+    d = I(val, encoding=encoding)
+
+    with d.temp_saved(strategy='memfd') as tmp:
+        assert tmp.strategy == 'memfd'
+        tmp.close()
+        assert open(tmp.name, 'rb').read() == val.encode(encoding)
+
+
+@pytest.mark.parametrize('strategy', ['copy', 'link', 'memfd', 'spooled'])
+def test_temp_saved_closes_file(tmpfile, strategy):
+    with open(tmpfile, 'wb') as f:
+        f.write(b'x' * 100)
+    if strategy == 'memfd':
+        if not hasattr(os, 'memfd_create'):
+            pytest.skip('memfd_create not available')
+        d = I(b'x' * 100)
+    elif strategy == 'spooled':
+        d = I(Unseekable(b'x' * 100)).spool(10)
+    else:
+        d = I(file=tmpfile)
+
+    with d.temp_saved(strategy=strategy,
+                      dir=os.path.dirname(tmpfile)) as tmp:
+        assert tmp.read() == b'x' * 100
+    assert tmp.closed
+    d.close()
+
+
+def test_with_temp_saved_unsupported_strategy():
+    with pytest.raises(ValueError):
+        with I(u'foo').temp_saved(strategy='link'):
+            pass
+
+
+def test_materialize(d, val, encoding):
+    assert d.materialize() is d
+
+    assert binary_type(d) == val.encode(encoding)
+    assert text_type(d) == val
+    assert binary_type(d) == val.encode(encoding)
+    assert d.read() == val
+
+
+def test_materialize_does_not_reread_file(valfile, val, encoding):
+    d = I(file=valfile, encoding=encoding).materialize()
+    os.unlink(valfile)
+
+    assert text_type(d) == val
+    assert binary_type(d) == val.encode(encoding)
+
+    open(valfile, 'w').close()
+
+
+def test_memoized_conversions(valfile, val, encoding):
+    d = I(open(valfile, 'rb'), encoding=encoding, memo_limit=1024)
+
+    assert binary_type(d) == val.encode(encoding)
+    assert binary_type(d) == val.encode(encoding)
+    assert text_type(d) == val
+
+
+def test_memo_limit_exceeded(valfile, val, encoding):
+    d = I(file=valfile, encoding=encoding, memo_limit=1)
+    binary_type(d)
+
+    assert d._memo_bytes is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4096])
+def test_iter_lines(d, val, encoding, chunk_size):
+    assert list(d.iter_lines(chunk_size=chunk_size)) ==\
+        StringIO(val).readlines()
+
+
+def test_iter_lines_no_keepends(d, val):
+    assert list(d.iter_lines(keepends=False)) == val.splitlines()
+
+
+def test_iter_lines_binary(d, val, encoding):
+    assert list(d.iter_lines(binary=True, chunk_size=3)) ==\
+        [l.encode(encoding) for l in StringIO(val).readlines()]
+
+
+def test_read_after_iteration(d, val, encoding):
+    lines = StringIO(val).readlines()
+    if len(lines) < 2:
+        return
+
+    assert next(d) == lines[0]
+    assert d.readline() == lines[1]
+    assert d.readb() == u''.join(lines[2:]).encode(encoding)
+
+
+def test_save_after_iteration(valfile, val, encoding):
+    lines = StringIO(val).readlines()
+    d = I(open(valfile, 'rb'), encoding=encoding)
+
+    with tempfile.TemporaryFile() as tmp:
+        for line in d:
+            break
+        d.save_to(tmp)
+
+        tmp.seek(0)
+        assert tmp.read() == u''.join(lines[1:]).encode(encoding)
+
+
+def test_move_after_partial_read(d, val):
+    lines = StringIO(val).readlines()
+    if lines:
+        assert next(d) == lines[0]
+
+    assert I(d).read() == u''.join(lines[1:])
+
+
+def test_move_keeps_read_ahead():
+    d = I(BytesIO(u'\xe4bc'.encode('utf8')), encoding='auto')
+    assert d.read(1) == u'\xe4'
+    assert I(d).read() == u'bc'
+
+    d = I(BytesIO(_compress('gzip', b'abcdef')), decompress='auto')
+    assert d.read(2) == u'ab'
+    assert I(d).read() == u'cdef'
+
+
+def _compress(name, buf):
+    if name == 'gzip':
+        import gzip
+        out = BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='wb') as f:
+            f.write(buf)
+        return out.getvalue()
+    elif name == 'bz2':
+        import bz2
+        return bz2.compress(buf)
+    elif name == 'xz':
+        lzma = pytest.importorskip('lzma')
+        return lzma.compress(buf)
+    elif name == 'none':
+        return buf
+    raise RuntimeError
+
+
+class Unseekable(object):
+    def __init__(self, buf):
+        self.buf = BytesIO(buf)
+
+    def read(self, *args):
+        return self.buf.read(*args)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(params=['gzip', 'bz2', 'xz', 'none'])
+def compression(request):
+    return request.param
+
+
+@pytest.fixture(params=['filename', 'string', 'file', 'unseekable'])
+def compressed(request, compression, val, encoding, tmpfile):
+    buf = _compress(compression, val.encode(encoding))
+
+    with open(tmpfile, 'wb') as f:
+        f.write(buf)
+
+    if request.param == 'filename':
+        return I(file=tmpfile, encoding=encoding, decompress='auto')
+    elif request.param == 'string':
+        return I(buf, encoding=encoding, decompress='auto')
+    elif request.param == 'file':
+        return I(open(tmpfile, 'rb'), encoding=encoding, decompress='auto')
+    elif request.param == 'unseekable':
+        return I(Unseekable(buf), encoding=encoding, decompress='auto')
+    raise RuntimeError
+
+
+def test_decompress_bytes(compressed, val, encoding):
+    assert binary_type(compressed) == val.encode(encoding)
+
+
+def test_decompress_unicode(compressed, val):
+    assert text_type(compressed) == val
+
+
+def test_decompress_read(compressed, val):
+    assert u''.join(compressed.iter_text_chunks(3)) == val
+
+
+def test_decompress_iteration(compressed, val):
+    assert list(compressed) == StringIO(val).readlines()
+
+
+def test_decompress_save_to(compressed, val, encoding):
+    with tempfile.TemporaryFile() as tmp:
+        compressed.save_to(tmp)
+
+        tmp.seek(0)
+        assert tmp.read() == val.encode(encoding)
+
+
+def test_decompress_temp_saved(compressed, val, encoding):
+    with compressed.temp_saved(strategy='auto') as tmp:
+        assert tmp.read() == val.encode(encoding)
+
+
+def test_decompress_multi_member_gzip():
+    buf = _compress('gzip', b'first\n') + _compress('gzip', b'second\n')
+
+    assert list(I(buf, decompress='auto')) == [u'first\n', u'second\n']
+
+
+def test_decompress_explicit():
+    assert binary_type(I(_compress('gzip', b'foo'), decompress='gzip')) ==\
+        b'foo'
+
+
+def test_decompress_not_by_default():
+    buf = _compress('gzip', b'foo')
+
+    assert binary_type(I(buf)) == buf
+
+
+def test_decompress_unknown():
+    with pytest.raises(ValueError):
+        I(b'foo', decompress='zip')
+
+
+@pytest.mark.parametrize('offset,length', [(0, None), (0, 3), (2, 5),
+                                           (3, None), (100, 4), (5, 0)])
+def test_read_range(d, val, encoding, offset, length):
+    buf = val.encode(encoding)
+    expected = buf[offset:] if length is None else buf[offset:offset + length]
+
+    assert d.read_range(offset, length) == expected
+
+
+def test_read_range_keeps_stream_position(d, val, encoding):
+    d.readb(2)
+    d.read_range(1, 4)
+
+    assert d.readb() == val.encode(encoding)[2:]
+
+
+def test_slicing(d, val, encoding):
+    buf = val.encode(encoding)
+
+    assert d[2:6] == buf[2:6]
+    assert d[3:] == buf[3:]
+    assert d[:4] == buf[:4]
+    assert d[6:2] == b''
+
+
+def test_slicing_negative(d, val, encoding):
+    buf = val.encode(encoding)
+
+    assert d[-2:] == buf[-2:]
+    assert d[1:-1] == buf[1:-1]
+    assert d[-3:-1] == buf[-3:-1]
+
+
+def test_read_range_of_compressed_file_like(tmpfile):
+    import gzip
+    with gzip.open(tmpfile, 'wb') as f:
+        f.write(b'0123456789')
+
+    with I(gzip.open(tmpfile, 'rb')) as d:
+        assert d.read_range(2, 3) == b'234'
+        assert d[0:5] == b'01234'
+
+
+def test_slicing_unsupported():
+    d = I(b'foo')
+
+    with pytest.raises(ValueError):
+        I(Unseekable(b'foo'))[-2:]
+    with pytest.raises(ValueError):
+        d[::2]
+    with pytest.raises(TypeError):
+        d[1]
+
+
+def test_read_range_compressed():
+    d = I(_compress('gzip', b'0123456789'), decompress='auto')
+
+    assert d.read_range(3, 4) == b'3456'
+
+
+def test_buffer_is_not_copied():
+    buf = bytearray(b'abc')
+    d = I(buf)
+    buf[0:1] = b'x'
+
+    assert d.data is buf
+    assert d.view().obj is buf
+    assert d.readb() == b'xbc'
+
+
+def test_array_input():
+    from array import array
+    a = array('H', [0x6261, 0x6463])
+    d = I(a)
+
+    assert bytes(d) == a.tobytes()
+    assert d.read_range(1, 2) == a.tobytes()[1:3]
+    assert d.view().nbytes == 4
+
+
+@pytest.mark.parametrize('size', [1, 3, 1000])
+def test_readinto(d, val, encoding, size):
+    expected = val.encode(encoding)
+    buf = bytearray(size)
+    result = b''
+
+    while True:
+        n = d.readinto(buf)
+        if not n:
+            break
+        result += bytes(buf[:n])
+
+    assert result == expected
+
+
+def test_readinto_after_readline(d, val, encoding):
+    d.readline()
+    rest = d.readb()
+    d.close()
+
+    # start over and compare with readinto
+    d = I(val, encoding=encoding)
+    d.readline()
+    buf = bytearray(len(rest) + 10)
+    n = d.readinto(buf)
+
+    assert bytes(buf[:n]) == rest
+
+
+@pytest.mark.parametrize('encoding', ['utf-8-sig', 'utf-16', 'utf-16-le',
+                                      'utf-16-be', 'utf-32', 'utf8',
+                                      'latin1'])
+@pytest.mark.parametrize('backing', ['bytes', 'file', 'filename',
+                                     'unseekable'])
+def test_auto_encoding(tmpfile, encoding, backing):
+    text = u'Sch\xf6ne Gr\xfc\xdfe\nzweite Zeile\n' * 500
+    buf = text.encode(encoding)
+    if encoding in ('utf-16-le', 'utf-16-be'):
+        # add the BOM the codec leaves out
+        buf = u'\ufeff'.encode(encoding) + buf
+
+    with open(tmpfile, 'wb') as f:
+        f.write(buf)
+
+    if backing == 'bytes':
+        d = I(buf, encoding='auto')
+    elif backing == 'file':
+        d = I(open(tmpfile, 'rb'), encoding='auto')
+    elif backing == 'filename':
+        d = I(file=tmpfile, encoding='auto')
+    else:
+        d = I(Unseekable(buf), encoding='auto')
+
+    with d:
+        assert repr(d).endswith("encoding='auto')")
+        assert d.read() == text
+        assert d.encoding in (encoding, 'utf-16', 'utf-8-sig')
+
+
+def test_auto_encoding_closes_file(tmpfile):
+    with open(tmpfile, 'wb') as f:
+        f.write(u'\xe4'.encode('latin1'))
+    d = I(file=tmpfile, encoding='auto')
+
+    assert text_type(d) == u'\xe4'
+    assert d._stream is None
+
+
+def test_auto_encoding_keeps_prefix():
+    text = u'a' * 5000 + u'\xe4'
+    buf = text.encode('utf8')
+    d = I(Unseekable(buf), encoding='auto')
+
+    assert d.encoding == 'utf8'
+    assert d.readb() == buf
+
+
+def test_auto_encoding_truncated_prefix(monkeypatch):
+    monkeypatch.setattr(I, 'sniff_size', 2)
+    d = I(BytesIO(u'\xe4\xe4'.encode('utf8')), encoding='auto')
+
+    assert d.encoding == 'utf8'
+
+
+def test_auto_encoding_fallback(monkeypatch):
+    monkeypatch.setattr(I, 'fallback_encoding', 'cp1252')
+
+    assert I(b'\x80 euro', encoding='auto').read() == u'€ euro'
+
+
+def test_auto_encoding_text():
+    assert I(u'\xe4', encoding='auto').readb() == b'\xc3\xa4'
+
+
+@pytest.mark.parametrize('algorithm', ['sha256', 'md5'])
+def test_digest(d, val, encoding, algorithm):
+    import hashlib
+    expected = hashlib.new(algorithm, val.encode(encoding)).hexdigest()
+
+    assert d.digest(algorithm) == expected
+
+
+def test_digest_of_large_file(tmpfile, monkeypatch):
+    import hashlib
+    monkeypatch.setattr(I, 'mmap_threshold', 1)
+    with open(tmpfile, 'wb') as f:
+        f.write(b'x' * 100000)
+
+    d = I(file=tmpfile)
+    assert d.digest() == hashlib.sha256(b'x' * 100000).hexdigest()
+
+
+def test_digest_is_cached(tmpfile, monkeypatch):
+    from data.cache import ContentCache
+    cache = ContentCache()
+    monkeypatch.setattr(I, 'digest_cache', cache)
+
+    with open(tmpfile, 'wb') as f:
+        f.write(b'foo')
+    first = I(file=tmpfile).digest()
+    assert I(file=tmpfile).digest() == first
+    assert cache.hits == 1
+
+    # a changed file is hashed again
+    with open(tmpfile, 'wb') as f:
+        f.write(b'quux')
+    assert I(file=tmpfile).digest() != first
+
+
+def test_digest_compressed():
+    import hashlib
+    d = I(_compress('gzip', b'foo'), decompress='auto')
+
+    assert d.digest() == hashlib.sha256(b'foo').hexdigest()
+
+
+def test_digest_many(tmpfile):
+    import hashlib
+    from data import digest_many
+
+    with open(tmpfile, 'wb') as f:
+        f.write(b'bar')
+    items = [I(b'foo'), I(file=tmpfile), I(u'baz'), I(BytesIO(b'qux'))]
+
+    assert digest_many(items, workers=2) == [
+        hashlib.sha256(v).hexdigest() for v in [b'foo', b'bar', b'baz',
+                                                 b'qux']]
+
+
+@pytest.fixture
+def many_files():
+    tmpdir = tempfile.mkdtemp()
+    paths = []
+    for i in range(20):
+        paths.append(os.path.join(tmpdir, str(i)))
+        with open(paths[-1], 'wb') as f:
+            f.write(str(i).encode('ascii') * 100)
+    try:
+        yield paths
+    finally:
+        for path in paths:
+            os.unlink(path)
+        os.rmdir(tmpdir)
+
+
+@pytest.mark.parametrize('max_bytes', [None, 1, 1000])
+def test_load_many(many_files, max_bytes):
+    from data import load_many
+    result = list(load_many(many_files, workers=3, max_bytes=max_bytes))
+
+    assert [d.filename for d in result] == many_files
+    for i, d in enumerate(result):
+        assert d._memo_bytes == str(i).encode('ascii') * 100
+        assert text_type(d) == text_type(i) * 100
+
+
+def test_load_many_unordered(many_files):
+    from data import load_many
+    result = load_many(many_files, ordered=False, max_open_fds=2,
+                       encoding='latin1')
+
+    assert sorted(d.filename for d in result) == sorted(many_files)
+
+
+def test_load_many_backpressure(many_files, monkeypatch):
+    from data import load_many
+    loaded = []
+    orig = I.materialize
+
+    def materialize(self):
+        loaded.append(self.filename)
+        return orig(self)
+    monkeypatch.setattr(I, 'materialize', materialize)
+
+    result = load_many(many_files, workers=2, max_bytes=250)
+    next(result)
+
+    # the first files are 100 bytes each, at most three fit the budget
+    assert len(loaded) <= 3
+    assert len(list(result)) == 19
+
+
+def test_load_many_error(many_files):
+    from data import load_many
+    result = load_many(many_files[:2] + ['/does/not/exist'])
+
+    assert next(result).filename == many_files[0]
+    assert next(result).filename == many_files[1]
+    with pytest.raises(IOError):
+        next(result)
+
+
+def test_size(d, val, encoding):
+    size = len(val.encode(encoding))
+    if d.text is not None and encoding == 'utf8' and len(val) != size:
+        # text is not encoded just to measure it
+        assert d.size is None
+        return
+
+    assert d.size == size
+    assert len(d) == size
+    assert d
+
+
+@pytest.mark.parametrize('backing', ['file', 'bytesio'])
+def test_size_of_file_like_after_reading(valfile, val, encoding, backing):
+    f = open(valfile, 'rb') if backing == 'file' else\
+        BytesIO(val.encode(encoding))
+
+    with I(f, encoding=encoding) as d:
+        d.readline()
+        size = d.size
+        assert size == len(d.readb())
+
+
+@pytest.mark.parametrize('text,encoding,size', [
+    (u'ascii', 'utf8', 5), (u'\xe4\xf6\xfc', 'utf8', None),
+    (u'\xe4', 'latin1', 1), (u'\u20ac', 'cp1252', 1),
+    (u'ascii', 'utf-16', None), (u'ascii', 'utf-8-sig', None),
+    (u'a+b', 'utf-7', None),
+])
+def test_size_of_text(text, encoding, size):
+    d = I(text, encoding=encoding)
+    if not hasattr(text, 'isascii'):
+        # ascii cannot be told apart cheaply before python 3.7
+        size = None if encoding == 'utf8' else size
+
+    assert d.size == size
+    assert d._memo_bytes is None
+
+
+def test_size_of_text_is_not_materialized():
+    from data import metrics
+    counter = metrics.add_hook(metrics.Counter())
+    try:
+        assert list(I(u'\xe4\n\xfc')) == [u'\xe4\n', u'\xfc']
+    finally:
+        metrics.remove_hook(counter)
+
+    assert not counter.total('materialize')
+
+
+def test_size_of_compressed_file_like(tmpfile):
+    import gzip
+    with gzip.open(tmpfile, 'wb') as f:
+        f.write(b'x' * 1200)
+
+    with I(gzip.open(tmpfile, 'rb')) as d:
+        assert d.size is None
+
+
+def test_size_unknown():
+    d = I(Unseekable(b'foo'))
+
+    assert d.size is None
+    with pytest.raises(TypeError):
+        len(d)
+    assert d
+    assert I(_compress('gzip', b'foo'), decompress='auto').size is None
+
+
+@pytest.mark.parametrize('max_size', [0, 3, 1 << 20])
+def test_spool(d, val, encoding, max_size):
+    buf = val.encode(encoding)
+    was_file = d.file is not None
+
+    assert d.spool(max_size) is d
+    assert d.file is None
+    if was_file and len(buf) > max_size:
+        assert d._spilled is not None
+        spilled = d.filename
+    else:
+        spilled = None
+
+    assert d.readb() == buf
+    assert bytes(d) == buf
+    assert d[1:3] == buf[1:3]
+
+    d.close()
+    if spilled:
+        assert not os.path.exists(spilled)
+
+
+def test_spool_unseekable():
+    text = u'\xe4 line\n' * 1000
+    f = Unseekable(text.encode('utf8'))
+    d = I(f, spool_threshold=100)
+
+    assert d.readline() == u'\xe4 line\n'
+    assert d._spilled is not None
+    assert d.size == len(text.encode('utf8'))
+    assert d.read() == text[7:]
+    assert text_type(d) == text
+
+    with d.temp_saved(strategy='auto') as tmp:
+        assert tmp.strategy == 'spooled'
+        assert tmp.name == d.filename
+        assert tmp.read() == text.encode('utf8')
+
+    assert os.path.exists(d.filename)
+    d.close()
+    assert not os.path.exists(tmp.name)
+
+
+def test_spool_in_memory(monkeypatch):
+    monkeypatch.setattr(I, 'spool_threshold', 100)
+    d = I(Unseekable(b'foo'))
+
+    assert d.readb(1) == b'f'
+    assert d.data == b'foo'
+    with d.temp_saved(strategy='auto') as tmp:
+        assert tmp.strategy != 'spooled'
+
+
+def test_spool_skips_regular_files(valfile, monkeypatch):
+    monkeypatch.setattr(I, 'spool_threshold', 1)
+
+    for f in (open(valfile, 'rb'), BytesIO(b'foo')):
+        d = I(f)
+        d.readb(1)
+        assert d.file is f and d._spilled is None
+        d.close()
+
+
+def test_spool_compressed(compressed, val, encoding):
+    compressed.spool(10)
+
+    assert compressed.readb() == val.encode(encoding)
+    assert bytes(compressed) == val.encode(encoding)
+    compressed.close()
+
+
+def test_spooled_file_removed_on_gc():
+    import gc
+    d = I(BytesIO(b'x' * 100)).spool(10)
+    name = d.filename
+
+    del d
+    gc.collect()
+    assert not os.path.exists(name)
+
+
+def test_spilled_file_moves_with_data():
+    d = I(BytesIO(b'x' * 100)).spool(10)
+    moved = I(d)
+
+    d.close()
+    assert moved.readb() == b'x' * 100
+    moved.close()
+
+
+def test_spilled_file_survives_original():
+    d = I(BytesIO(b'x' * 100)).spool(10)
+    moved = I(d)
+    name = moved.filename
+
+    del d
+    gc.collect()
+    assert moved.readb() == b'x' * 100
+
+    moved.close()
+    gc.collect()
+    assert not os.path.exists(name)
+
+
+def test_tee(d, val, encoding):
+    a, b = d.tee()
+
+    assert a.readline() == (val.splitlines(True) or [u''])[0]
+    assert b.read() == val
+    assert a.readb() == val.encode(encoding)[
+        len((val.splitlines(True) or [u''])[0].encode(encoding)):]
+
+    a.close()
+    b.close()
+
+
+def test_tee_unseekable():
+    text = u'\xe4 line\n' * 10000
+    closed = []
+
+    class Source(Unseekable):
+        def close(self):
+            closed.append(True)
+
+    d = I(Source(text.encode('utf8')))
+    parts = d.tee(3, max_memory=1000)
+
+    assert [p.readline() for p in parts] == [u'\xe4 line\n'] * 3
+    assert text_type(parts[0]) == text[7:]
+    assert list(parts[1]) == text.splitlines(True)[1:]
+    assert parts[2].readb() == text.encode('utf8')[8:]
+
+    for p in parts:
+        p.close()
+    assert closed
+
+
+def test_tee_random_access():
+    a, b = I(BytesIO(b'abc')).tee()
+
+    with pytest.raises(ValueError):
+        a.read_range(1, 1)
+    with pytest.raises(ValueError):
+        b[1:]
+    assert a.read() == b.read() == u'abc'
+
+
+def test_line_access(d, val, encoding):
+    if d.file is not None:
+        d.spool()
+    lines = val.splitlines(True)
+
+    assert d.line_count() == len(lines)
+    for i, line in enumerate(lines):
+        assert d.line(i) == line
+    assert d.lines() == lines
+    assert d.lines(1, 3) == lines[1:3]
+    assert d.lines(-2) == lines[-2:]
+
+    with pytest.raises(IndexError):
+        d.line(len(lines))
+
+
+def test_line_access_compressed(compressed, val, encoding):
+    if compressed.file is not None:
+        with pytest.raises(ValueError):
+            compressed.line_count()
+        return
+
+    assert compressed.lines() == val.splitlines(True)
+
+
+def test_line_index_unsupported_encoding():
+    with pytest.raises(ValueError):
+        I(u'a\nb'.encode('utf-16'), encoding='utf-16').line(0)
+
+
+def test_line_access_text(monkeypatch):
+    d = I(u'\xe4\n\u20ac\nx', encoding='utf-16')
+    monkeypatch.setattr(I, '__bytes__', None)
+
+    assert d.line_index().starts.tolist() == [0, 2, 4]
+    assert d.line(1) == u'\u20ac\n'
+    assert d.lines(1) == [u'\u20ac\n', u'x']
+
+
+def test_line_index_persisted(tmpfile):
+    from data.lineindex import SUFFIX
+    with open(tmpfile, 'wb') as f:
+        f.write(b'one\ntwo\n')
+
+    try:
+        assert I(file=tmpfile).line_index(persist=True)
+        assert os.path.exists(tmpfile + SUFFIX)
+        assert I(file=tmpfile).line(1) == u'two\n'
+
+        d = I(file=tmpfile)
+        assert d.line_index(persist=True).starts.tolist() == [0, 4]
+
+        # changes to the file invalidate both saved and in-memory indexes
+        with open(tmpfile, 'ab') as f:
+            f.write(b'three\n')
+        assert d.line_count() == 3
+        assert I(file=tmpfile).line_index(persist=True).size == 14
+    finally:
+        os.unlink(tmpfile + SUFFIX)
+
+
+def _chunk_lines(chunk):
+    return list(chunk)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_map_chunks(d, val, encoding, chunk_size):
+    result = d.map_chunks(_chunk_lines, workers=2, chunk_size=chunk_size)
+
+    chunks = list(result)
+    assert sum(chunks, []) == val.splitlines(True)
+    assert all(chunk for chunk in chunks)
+
+
+@pytest.mark.parametrize('backing', ['filename', 'bytes'])
+def test_map_chunks_processes(valfile, val, encoding, backing):
+    d = I(file=valfile, encoding=encoding) if backing == 'filename' else\
+        I(val.encode(encoding), encoding=encoding)
+    result = d.map_chunks(_chunk_lines, workers=2, executor='process',
+                          chunk_size=7)
+
+    assert sum(result, []) == val.splitlines(True)
+
+
+def test_map_chunks_unaligned(tmpfile):
+    with open(tmpfile, 'wb') as f:
+        f.write(b'0123456789' * 1000)
+
+    chunks = list(I(file=tmpfile).map_chunks(bytes, chunk_size=3000,
+                                             align=None))
+    assert [len(c) for c in chunks] == [3000, 3000, 3000, 1000]
+    assert b''.join(chunks) == b'0123456789' * 1000
+
+
+def test_map_chunks_large_file(tmpfile):
+    lines = [u'line {}\n'.format(i) * (i % 7) for i in range(20000)]
+    with open(tmpfile, 'wb') as f:
+        f.write(u''.join(lines).encode('utf8'))
+
+    result = I(file=tmpfile).map_chunks(_chunk_lines, workers=3,
+                                        chunk_size=10000, ordered=False)
+    chunks = list(result)
+
+    assert len(chunks) > 10
+    assert sorted(sum(chunks, [])) == sorted(
+        u''.join(lines).splitlines(True))
+
+
+def test_map_chunks_partially_read():
+    d = I(BytesIO(b'a\nbbbbbbbb\ncc\ndd\n'))
+    assert d.read(2) == u'a\n'
+
+    result = d.map_chunks(text_type, chunk_size=3)
+    assert list(result) == [u'bbbbbbbb\n', u'cc\n', u'dd\n']
+
+
+def test_map_chunks_pipe():
+    r, w = os.pipe()
+    with os.fdopen(w, 'wb') as f:
+        f.write(b'a\nb\nc\n')
+
+    with I(os.fdopen(r, 'rb')) as d:
+        result = d.map_chunks(text_type, chunk_size=1)
+        assert list(result) == [u'a\n', u'b\n', u'c\n']
+
+
+def test_map_chunks_checks_arguments():
+    with pytest.raises(ValueError):
+        I(b'a').map_chunks(len, align='word')
+    with pytest.raises(ValueError):
+        I(b'a').map_chunks(len, executor='fiber')
+
+
+def test_map_chunks_bounds_pending():
+    from concurrent.futures import ThreadPoolExecutor
+    submitted = []
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, *args):
+            submitted.append(args)
+            return ThreadPoolExecutor.submit(self, *args)
+
+    with Executor(1) as executor:
+        result = I(b'a\n' * 100).map_chunks(
+            len, workers=2, executor=executor, chunk_size=1)
+        assert next(result) == 2
+        assert len(submitted) == 4
+        assert sum(result) == 198
+
+
+def test_map_chunks_custom_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(1) as executor:
+        result = I(b'a\nb\n').map_chunks(text_type, executor=executor,
+                                         chunk_size=1)
+        assert list(result) == [u'a\n', u'b\n']
+        assert executor.submit(len, 'x').result() == 1
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from data.lineindex import LineIndex
+
+
+@pytest.mark.parametrize('buf', [b'', b'a', b'\n', b'a\n', b'\n\n',
+                                 b'one\ntwo\nthree', b'one\ntwo\nthree\n'])
+@pytest.mark.parametrize('block_size', [1, 2, 5, 1000])
+def test_build(buf, block_size):
+    blocks = [buf[i:i + block_size] for i in range(0, len(buf), block_size)]
+    index = LineIndex.build(blocks)
+
+    lines = buf.splitlines(True)
+    assert len(index) == len(lines)
+    assert index.size == len(buf)
+    for i, line in enumerate(lines):
+        offset, length = index.span(i, i + 1)
+        assert buf[offset:offset + length] == line
+
+
+def test_build_text():
+    index = LineIndex.build([u'\xe4\n\xfc', u'\n\u20ac'])
+
+    assert index.starts.tolist() == [0, 2, 4]
+    assert index.size == 5
+
+
+def test_span():
+    index = LineIndex.build([b'one\ntwo\nthree'])
+
+    assert index.span(0) == (0, 13)
+    assert index.span(1, 2) == (4, 4)
+    assert index.span(-1) == (8, 5)
+    assert index.span(2, 10) == (8, 5)
+    assert index.span(2, 1) == (0, 0)
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('index'))
+    index = LineIndex.build([b'one\ntwo\nthree'], (13, 12345))
+    index.save(path)
+
+    loaded = LineIndex.load(path, (13, 12345))
+    assert list(loaded.starts) == list(index.starts)
+    assert loaded.size == 13
+
+    assert LineIndex.load(path, (13, 12346)) is None
+    assert LineIndex.load(path, (14, 12345)) is None
+    assert LineIndex.load(str(tmpdir.join('missing')), (13, 12345)) is None
+    assert os.listdir(str(tmpdir)) == ['index']
+
+
+def test_load_truncated(tmpdir):
+    path = str(tmpdir.join('index'))
+    LineIndex.build([b'one\ntwo\nthree'], (13, 1)).save(path)
+
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 4)
+    assert LineIndex.load(path, (13, 1)) is None
+
+
+def test_save_and_load_32_bit(tmpdir, monkeypatch):
+    from data import lineindex
+    path = str(tmpdir.join('index'))
+    LineIndex.build([b'one\ntwo\nthree'], (13, 1)).save(path)
+
+    # platforms without a 64 bit array type read and write the same format
+    monkeypatch.setattr(lineindex, 'TYPECODE', 'I')
+    index = LineIndex.load(path, (13, 1))
+    assert index.starts.typecode == 'I'
+    assert index.starts.tolist() == [0, 4, 8]
+    index.save(path)
+
+    monkeypatch.undo()
+    assert LineIndex.load(path, (13, 1)).starts.tolist() == [0, 4, 8]
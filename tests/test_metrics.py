@@ -0,0 +1,66 @@
+from six import binary_type, text_type
+import pytest
+
+from data import Data, metrics
+
+
+@pytest.fixture
+def counter():
+    counter = metrics.add_hook(metrics.Counter())
+    yield counter
+    metrics.remove_hook(counter)
+
+
+@pytest.fixture
+def fn(tmpdir):
+    fn = tmpdir.join('input.txt')
+    fn.write_binary(u'\xe4bc\n'.encode('utf8') * 100)
+    return str(fn)
+
+
+def test_no_hooks_registered():
+    assert metrics.hooks == []
+
+
+def test_bytes_read_and_materialized(counter, fn):
+    binary_type(Data(file=fn))
+
+    assert counter.total('bytes_read', backing='filename') == 500
+    assert counter.total('materialize', type='bytes') == 1
+
+
+def test_decode(counter, fn):
+    assert text_type(Data(file=fn)) == u'\xe4bc\n' * 100
+
+    assert counter.total('materialize', type='text') == 1
+    assert counter.total('decode_seconds') > 0
+
+
+def test_incremental_reads(counter, fn):
+    d = Data(open(fn, 'rb'))
+    list(d.iter_text_chunks(7))
+
+    assert counter.total('bytes_read', backing='file') == 500
+    assert counter.total('materialize') == 0
+
+
+def test_encode(counter):
+    binary_type(Data(u'\xe4bc'))
+
+    assert counter.total('encode_seconds', backing='text') > 0
+
+
+def test_save_to(counter, fn, tmpdir):
+    Data(file=fn).save_to(str(tmpdir.join('out')))
+    Data(u'foo').save_to(str(tmpdir.join('out')))
+
+    assert counter.total('save_to', backing='text', method='write') == 1
+    assert counter.total('save_to', backing='filename') == 1
+    assert counter.total('bytes_written') == 503
+
+
+def test_snapshot_reset(counter):
+    binary_type(Data(u'foo'))
+
+    assert counter.snapshot(reset=True)
+    assert counter.snapshot() == {}